@@ -0,0 +1,317 @@
+"""
+Simple benchmarks for the Table class
+
+Usage:
+	python benchmark.py [rows ...]
+	python benchmark.py suite [--sizes 10000,1000000,10000000] [--baseline baseline.json] [--save] [--threshold 0.25]
+
+The suite generates students and classes shaped JSON and CSV files of
+each size, times loading them and each query operator, and records the
+throughput of each and the peak memory of each size, which is run in
+its own process.  Given a baseline it exits with a non-zero status if
+any timing or peak memory grew by more than the threshold, and with
+--save it writes the results as the new baseline.
+"""
+
+# Python Includes
+import sys, os, random, json, csv, shutil, tempfile, optparse, subprocess
+from time import time
+from cStringIO import StringIO
+
+# Package includes
+import table
+from table import Table
+
+def make_table(rows):
+	"""build a Table instance without printing load messages
+
+	Keyword arguments:
+	rows (list): the rows to place in the table
+
+	Returns:
+	Table: a table containing ``rows``
+	"""
+	tbl = Table()
+	tbl._setdata(rows)
+	return tbl
+
+def make_events(count, dimensions, seed=1):
+	"""generate ``count`` event rows referencing ``dimensions`` dimension ids
+
+	Returns:
+	list: the generated rows
+	"""
+	rnd = random.Random(seed)
+	return [{"id": i, "dim_id": rnd.randint(1, dimensions), "value": rnd.random()} for i in range(count)]
+
+def make_dimensions(count):
+	"""generate ``count`` dimension rows
+
+	Returns:
+	list: the generated rows
+	"""
+	return [{"dim_id": i, "name": "dim%d" % i} for i in range(1, count + 1)]
+
+_NAMES = ["Steve", "Caroline", "Frank", "Jacinta", "Rupert", "Guiseppe", "Penny", "Maria", "Prudence", "Ferdinand"]
+
+def make_students(count, classes, seed=1):
+	"""generate ``count`` rows shaped like students.json, in ``classes`` classes
+
+	Returns:
+	iterator: the generated rows
+	"""
+	rnd = random.Random(seed)
+	for i in xrange(1, count + 1):
+		yield {"id": i, "name": "%s%d" % (rnd.choice(_NAMES), rnd.randint(1, 9999)), "class_id": rnd.randint(1, classes), "paid": rnd.random() < 0.4}
+
+def make_classes(count):
+	"""generate ``count`` rows shaped like classes.json
+
+	Returns:
+	iterator: the generated rows
+	"""
+	for i in xrange(1, count + 1):
+		yield {"class_id": i, "name": "class%d" % i}
+
+def write_json(file_name, rows):
+	"""write ``rows`` to a file as one JSON object per line"""
+	with open(file_name, "wb") as f:
+		for row in rows:
+			f.write(json.dumps(row) + "\n")
+
+def write_csv(file_name, rows, columns):
+	"""write ``rows`` to a CSV file with the header ``columns``"""
+	with open(file_name, "wb") as f:
+		writer = csv.writer(f)
+		writer.writerow(columns)
+		for row in rows:
+			writer.writerow([str(row[col]).lower() if type(row[col]) is bool else row[col] for col in columns])
+
+def quiet(func, *args):
+	"""call ``func`` with ``args`` without printing the Table load messages"""
+	stdout, sys.stdout = sys.stdout, StringIO()
+	try:
+		return func(*args)
+	finally:
+		sys.stdout = stdout
+
+def timed(func, *args):
+	"""call ``func`` with ``args`` and return the elapsed time and result"""
+	start = time()
+	res = func(*args)
+	return time() - start, res
+
+def nested_loop_join(outer, inner, column, alias):
+	"""join every row in ``outer`` to every row in ``inner`` with an equal value in ``column``
+
+	The reference the hash join is checked and timed against.
+
+	Keyword arguments:
+	outer (list): rows which are copied into the result
+	inner (list): rows which are added to the result under ``alias``
+	column (str): the name of the column on which to join
+	alias (str): the alias applied to the columns of ``inner``
+
+	Returns:
+	list: the joined rows
+	"""
+	joined = []
+	for item in outer:
+		for oitem in inner:
+			if item[column] == oitem[column]:
+				n_item = dict(item)
+				n_item.update(table._alias_row(oitem, alias))
+				joined.append(n_item)
+	return joined
+
+def bench_join(sizes=(1000, 10000, 100000, 1000000), dimensions_ratio=40, nested_limit=10000):
+	"""time the hash join against the nested loop join for growing row counts
+
+	The nested loop join is only timed up to ``nested_limit`` rows as it
+	grows quadratically.
+
+	Keyword arguments:
+	sizes (list): the number of event rows to join
+	dimensions_ratio (int): events per dimension row
+	nested_limit (int): the largest size the nested loop join is timed for
+	"""
+	print "%10s %10s %12s %12s %14s" % ("events", "dims", "hash (s)", "nested (s)", "hash rows/s")
+	for size in sizes:
+		dims = max(1, size // dimensions_ratio)
+		events = make_table(make_events(size, dims))
+		dimensions = make_table(make_dimensions(dims))
+
+		hash_time, res = timed(lambda: events.join(dimensions, "dim_id", "d")(False))
+		nested = "-"
+		if size <= nested_limit:
+			nested_time, nres = timed(nested_loop_join, events.data, dimensions.data, "dim_id", "d")
+			assert nres == res
+			nested = "%12.3f" % nested_time
+		print "%10d %10d %12.3f %12s %14d" % (size, dims, hash_time, nested, size / max(hash_time, 1e-9))
+
+def suite_queries(classes):
+	"""get the name of each benchmarked query and a function which runs it on a students table
+
+	Keyword arguments:
+	classes (Table): the classes table joined to the students
+	"""
+	return [
+		("eq", lambda tbl: tbl.eq("class_id", 3)(False)),
+		("ne", lambda tbl: tbl.ne("class_id", 3)(False)),
+		("gt", lambda tbl: tbl.gt("id", 100)(False)),
+		("lt", lambda tbl: tbl.lt("id", 100)(False)),
+		("isin", lambda tbl: tbl.isin("class_id", [1, 2, 3])(False)),
+		("notin", lambda tbl: tbl.notin("class_id", [1, 2, 3])(False)),
+		("like", lambda tbl: tbl.like("name", "^Pr.*7$")(False)),
+		("notlike", lambda tbl: tbl.notlike("name", "an")(False)),
+		("orderby", lambda tbl: tbl.orderby("name")(False)),
+		("groupby", lambda tbl: tbl.groupby("class_id").agg(count=None, sum="id")(False)),
+		("distinct", lambda tbl: tbl.distinct("class_id")(False)),
+		("join", lambda tbl: tbl.join(classes, "class_id", "c")(False)),
+		("rjoin", lambda tbl: tbl.rjoin(classes, "class_id", "c")(False)),
+		("count", lambda tbl: tbl.eq("paid", True).count()(False)),
+		("sum", lambda tbl: tbl.sum("id")(False)),
+		("min", lambda tbl: tbl.min("id")(False)),
+		("max", lambda tbl: tbl.max("id")(False)),
+		("avg", lambda tbl: tbl.avg("id")(False)),
+	]
+
+def measure(func, rows, repeat=1):
+	"""time the best of ``repeat`` calls of ``func``
+
+	Keyword arguments:
+	func (function): the benchmarked call
+	rows (int): the number of rows processed by each call
+	repeat (int): the number of times ``func`` is called (default: 1)
+
+	Returns:
+	dict: the 'seconds' and 'rows_per_sec'
+	"""
+	best = min(quiet(timed, func)[0] for i in range(repeat))
+	return {"seconds": best, "rows_per_sec": rows / max(best, 1e-9)}
+
+def run_suite(size, workdir, classes=40, columnar=False, repeat=3):
+	"""generate ``size`` students and time loading them and each query
+
+	Keyword arguments:
+	size (int): the number of student rows
+	workdir (str): a directory for the generated files
+	classes (int): the number of classes (default: 40)
+	columnar (bool): store the students as typed columns (default: False)
+	repeat (int): the number of times each query is timed (default: 3)
+
+	Returns:
+	dict: the measurements of each benchmark by name under 'benchmarks', and the 'peak_rss' of the process in bytes
+	"""
+	json_file = os.path.join(workdir, "students_%d.json" % size)
+	csv_file = os.path.join(workdir, "students_%d.csv" % size)
+	write_json(json_file, make_students(size, classes))
+	write_csv(csv_file, make_students(size, classes), ["id", "name", "class_id", "paid"])
+
+	res = {}
+	res["load_csv"] = measure(lambda: Table(columnar=columnar).load_csv(csv_file), size)
+	students = Table(columnar=columnar)
+	res["load_json"] = measure(lambda: students.load_json(json_file), size)
+	dimensions = make_table(list(make_classes(classes)))
+	for name, query in suite_queries(dimensions):
+		res[name] = measure(lambda: query(students), size, repeat)
+	export_file = os.path.join(workdir, "export_%d.json" % size)
+	def export():
+		# export doesn't overwrite files, so the file of the previous run is removed first
+		if os.path.exists(export_file):
+			os.remove(export_file)
+		students.export(export_file)(False)
+		if not os.path.exists(export_file):
+			raise RuntimeError("export to %s failed" % export_file)
+	res["export"] = measure(export, size)
+	return {"benchmarks": res, "peak_rss": table._peak_memory()}
+
+def run_size(size, workdir, columnar=False):
+	"""run the suite for ``size`` rows in a new process, so its peak memory isn't raised by the other sizes
+
+	Returns:
+	dict: the results of ``run_suite``
+	"""
+	args = [sys.executable, os.path.abspath(__file__), "suite-size", str(size), workdir]
+	if columnar:
+		args.append("--columnar")
+	return json.loads(subprocess.check_output(args))
+
+def compare(results, baseline, threshold, min_seconds=0.01):
+	"""find the measurements which regressed from ``baseline``
+
+	Timings shorter than ``min_seconds`` in the baseline are too noisy to
+	compare and are skipped.
+
+	Keyword arguments:
+	results (dict): the results of ``run_suite`` by size
+	baseline (dict): the baseline results in the same layout
+	threshold (float): the fraction a timing or peak memory may grow by
+	min_seconds (float): the shortest baseline timing which is compared (default: 0.01)
+
+	Returns:
+	list: a description of each regression
+	"""
+	def check(size, name, old, new):
+		if old is not None and new is not None and new > old * (1 + threshold):
+			regressions.append("%s rows %s: %.4g -> %.4g (+%.0f%%)" % (size, name, old, new, (new / float(old) - 1) * 100))
+
+	regressions = []
+	for size, res in sorted(results.items()):
+		base = baseline.get(size)
+		if base is None:
+			continue
+		check(size, "peak_rss", base.get("peak_rss"), res["peak_rss"])
+		for name, metrics in sorted(res["benchmarks"].items()):
+			old = base.get("benchmarks", {}).get(name, {}).get("seconds")
+			if old is not None and old >= min_seconds:
+				check(size, name + " seconds", old, metrics["seconds"])
+	return regressions
+
+def suite(argv):
+	"""run the benchmark suite from the command line arguments ``argv``
+
+	Returns:
+	int: the exit status, 1 if a measurement regressed from the baseline
+	"""
+	parser = optparse.OptionParser(usage="python benchmark.py suite [options]")
+	parser.add_option("--sizes", default="10000,1000000,10000000", help="comma separated student row counts")
+	parser.add_option("--baseline", default="benchmark_baseline.json", help="JSON file of the baseline measurements")
+	parser.add_option("--save", action="store_true", default=False, help="write the measurements as the new baseline")
+	parser.add_option("--threshold", type="float", default=0.25, help="fraction a measurement may grow by before it is a regression")
+	parser.add_option("--columnar", action="store_true", default=False, help="store the students as typed columns")
+	options, args = parser.parse_args(argv)
+
+	results = {}
+	workdir = tempfile.mkdtemp()
+	try:
+		for size in [int(size) for size in options.sizes.split(",")]:
+			results[str(size)] = res = run_size(size, workdir, options.columnar)
+			print "%10s %10s %12s %14s" % ("rows", "benchmark", "time (s)", "rows/s")
+			for name, metrics in sorted(res["benchmarks"].items()):
+				print "%10d %10s %12.3f %14d" % (size, name, metrics["seconds"], metrics["rows_per_sec"])
+			print "%10d peak memory %.1f MB" % (size, (res["peak_rss"] or 0) / 1048576.0)
+	finally:
+		shutil.rmtree(workdir)
+
+	status = 0
+	if os.path.isfile(options.baseline):
+		with open(options.baseline) as f:
+			regressions = compare(results, json.load(f), options.threshold)
+		for regression in regressions:
+			print "Regression: " + regression
+		status = 1 if regressions else 0
+	if options.save:
+		with open(options.baseline, "w") as f:
+			json.dump(results, f, indent=2, sort_keys=True)
+	return status
+
+if __name__ == "__main__":
+	if sys.argv[1:2] == ["suite"]:
+		sys.exit(suite(sys.argv[2:]))
+	if sys.argv[1:2] == ["suite-size"]:
+		# a single size of the suite, run in its own process by suite()
+		print json.dumps(run_suite(int(sys.argv[2]), sys.argv[3], columnar="--columnar" in sys.argv[4:]))
+		sys.exit(0)
+	sizes = [int(arg) for arg in sys.argv[1:]] or (1000, 10000, 100000, 1000000)
+	bench_join(sizes)
@@ -23,11 +23,18 @@ THE SOFTWARE.
 """
 
 # Python Includes
-import json, re, calendar, os, copy, csv
+import json, re, calendar, os, copy, csv, operator, sys, struct, mmap, marshal, gzip, bz2, math, heapq, tempfile, hashlib
+import sre_parse, sre_constants, weakref
+from cStringIO import StringIO
+from array import array
 from time import time
 from datetime import datetime
 from operator import itemgetter
-from collections import defaultdict
+from collections import defaultdict, deque, OrderedDict
+from itertools import islice, imap, chain
+from bisect import bisect_left, bisect_right
+from multiprocessing import Pool, cpu_count
+from threading import Lock
 
 # Package includes
 _prettytable = False
@@ -38,15 +45,2795 @@ except Exception, e:
 	print "Unable to import prettytable. install using 'easy_install prettytable'"
 	print e.message
 
+_numpy = False
+try:
+	import numpy
+	_numpy = True
+except ImportError:
+	pass
+
+_resource = False
+try:
+	import resource
+	_resource = True
+except ImportError:
+	pass
+
+_futures = False
+try:
+	from concurrent.futures import ThreadPoolExecutor
+	_futures = True
+except ImportError:
+	pass
+
 __version__ = 0.1
 
+def _alias_row(row, alias):
+	"""build a copy of ``row`` with each key prefixed by ``alias``
+
+	Keyword arguments:
+	row (dict): the row to be aliased
+	alias (str): the alias prefixed to each key
+
+	Returns:
+	dict: the aliased row
+	"""
+	return dict(("%s.%s" % (alias, key), value) for key, value in row.items())
+
+def _join_key(columns):
+	"""get a function which returns the join key of a row dictionary, a tuple if there is more than one column
+
+	Rows which don't contain every key column have the key ``_MISSING`` and
+	don't match any row.
+	"""
+	if len(columns) == 1:
+		col = columns[0]
+		return lambda item: item.get(col, _MISSING)
+	def key(item):
+		values = tuple(item.get(col, _MISSING) for col in columns)
+		return _MISSING if any(value is _MISSING for value in values) else values
+	return key
+
+def _hash_matches(outer_keys, inner_keys):
+	"""find the (outer, inner) positions of the rows with equal keys using a hash table on the smaller input
+
+	Returns:
+	list: the position pairs in order of outer then inner position
+	"""
+	build = defaultdict(list)
+	if len(inner_keys) <= len(outer_keys):
+		# build on inner, probe with outer in order
+		for pos, key in enumerate(inner_keys):
+			if key is not _MISSING:
+				build[key].append(pos)
+		return [(i, j) for i, key in enumerate(outer_keys) for j in build.get(key, ())]
+
+	# build on outer, stream inner and bucket the matches by outer row
+	for pos, key in enumerate(outer_keys):
+		if key is not _MISSING:
+			build[key].append(pos)
+	matches = defaultdict(list)
+	for j, key in enumerate(inner_keys):
+		for i in build.get(key, ()):
+			matches[i].append(j)
+	return [(i, j) for i in sorted(matches) for j in matches[i]]
+
+def _merge_matches(outer_keys, inner_keys):
+	"""find the (outer, inner) positions of the rows with equal keys in two inputs sorted by key
+
+	Returns:
+	iterator: the position pairs in order of outer then inner position
+	"""
+	i = j = 0
+	n, m = len(outer_keys), len(inner_keys)
+	while i < n and j < m:
+		a, b = outer_keys[i], inner_keys[j]
+		if a is _MISSING or a < b:
+			i += 1
+		elif b is _MISSING or b < a:
+			j += 1
+		else:
+			i_end, j_end = i + 1, j + 1
+			while i_end < n and outer_keys[i_end] == a:
+				i_end += 1
+			while j_end < m and inner_keys[j_end] == b:
+				j_end += 1
+			for x in xrange(i, i_end):
+				for y in xrange(j, j_end):
+					yield x, y
+			i, j = i_end, j_end
+
+def _nested_matches(outer_keys, inner_keys):
+	"""find the (outer, inner) positions of the rows with equal keys by comparing every pair"""
+	for i, a in enumerate(outer_keys):
+		if a is not _MISSING:
+			for j, b in enumerate(inner_keys):
+				if a == b:
+					yield i, j
+
+def _index_matches(outer_keys, index):
+	"""find the (outer, inner) positions of the rows with equal keys with a hash index on the inner rows"""
+	positions = index.positions
+	for i, key in enumerate(outer_keys):
+		if key is not _MISSING:
+			for j in positions.get(key, ()):
+				yield i, j
+
+# Variants of join and whether they keep the outer and inner rows without a match
+_join_kinds = {
+	'inner': (False, False),
+	'left': (True, False),
+	'right': (False, True),
+	'outer': (True, True),
+	'semi': (False, False),
+	'anti': (False, False)
+}
+
+def _join(outer, inner, outer_key, inner_key, alias, how='inner', strategy='hash'):
+	"""join each row in ``outer`` to the rows in ``inner`` with equal key columns
+
+	The rows are returned in the same order as a nested loop over ``outer``
+	then ``inner`` would produce.  Unmatched rows kept by outer joins don't
+	contain the columns of the other input, and the unmatched ``inner``
+	rows of a right or full outer join follow the matched rows.
+
+	Keyword arguments:
+	outer (list): rows which are copied into the result
+	inner (list or tuple): rows which are added to the result under ``alias``, or for the 'index' strategy a hash index on ``inner_key`` and a function which builds the inner row in a position
+	outer_key (list): the key columns of ``outer``
+	inner_key (list): the key columns of ``inner``
+	alias (str): the alias applied to the columns of ``inner``
+	how (str): 'inner', 'left', 'right', 'outer', or 'semi' and 'anti' which keep the rows of ``outer`` with and without a match (default: 'inner')
+	strategy (str): 'hash', 'merge' for inputs sorted by key, or 'index' (default: 'hash')
+
+	Returns:
+	list: the joined rows
+	"""
+	outer_keys = map(_join_key(outer_key), outer)
+	if strategy == 'index':
+		index, fetch = inner
+		pairs = _index_matches(outer_keys, index)
+	else:
+		inner_keys = map(_join_key(inner_key), inner)
+		fetch = inner.__getitem__
+		if strategy == 'merge':
+			pairs = _merge_matches(outer_keys, inner_keys)
+		else:
+			try:
+				pairs = _hash_matches(outer_keys, inner_keys)
+			except TypeError:
+				# unhashable join values (e.g. lists) can only be compared
+				pairs = _nested_matches(outer_keys, inner_keys)
+
+	if how in ('semi', 'anti'):
+		matched = set(i for i, j in pairs)
+		return [item for i, item in enumerate(outer) if (i in matched) == (how == 'semi')]
+
+	keep_outer, keep_inner = _join_kinds[how]
+	joined = []
+	aliased = {}
+	last = -1
+	for i, j in pairs:
+		if keep_outer:
+			joined.extend(copy.copy(item) for item in outer[last + 1:i])
+		if j not in aliased:
+			aliased[j] = _alias_row(fetch(j), alias)
+		n_item = copy.copy(outer[i])
+		n_item.update(aliased[j])
+		joined.append(n_item)
+		last = i
+	if keep_outer:
+		joined.extend(copy.copy(item) for item in outer[last + 1:])
+	if keep_inner:
+		joined.extend(_alias_row(item, alias) for j, item in enumerate(inner) if j not in aliased)
+	return joined
+
+class _Missing(object):
+	"""marks a row which doesn't contain a column in columnar storage"""
+	def __reduce__(self):
+		# unpickles as the module level instance so identity checks work in every process
+		return '_MISSING'
+
+	def __repr__(self):
+		return '_MISSING'
+
+_MISSING = _Missing()
+
+# Comparisons which can be evaluated as masks over typed columns, and the values they accept
+_mask_ops = {'eq': operator.eq, 'ne': operator.ne, 'gt': operator.gt, 'lt': operator.lt, 'ge': operator.ge, 'le': operator.le}
+_mask_types = (int, float, bool)
+
+# Number of rows evaluated in each block of a masked scan
+_MASK_BLOCK = 65536
+
+class _Mapped(object):
+	"""a region of a memory mapped snapshot file
+
+	Attributes:
+		buf (mmap): the mapped file
+		offset (int): the offset of the region in the file
+		size (int): the size of the region in bytes
+	"""
+	def __init__(self, buf, offset, size):
+		self.buf = buf
+		self.offset = offset
+		self.size = size
+
+	def read(self):
+		"""copy the region into a string"""
+		return self.buf[self.offset:self.offset + self.size]
+
+	def array(self, typecode):
+		"""copy the region into an ``array.array`` of ``typecode``"""
+		values = array(typecode)
+		values.fromstring(self.read())
+		return values
+
+	def json(self):
+		"""decode the region as JSON"""
+		return json.loads(self.read())
+
+	def view(self, typecode):
+		"""get a NumPy array of ``typecode`` which reads the region directly from the mapped file"""
+		itemsize = array(typecode).itemsize
+		return numpy.frombuffer(self.buf, dtype=typecode, count=self.size // itemsize, offset=self.offset)
+
+class _ArrayColumn(object):
+	"""a column of ``int`` or ``float`` values packed into an ``array.array``
+
+	A column reloaded from a snapshot keeps its values in the snapshot
+	until they are first read.
+
+	Attributes:
+		values (array): the packed column values
+		typecode (str): the ``array`` typecode of the values
+		pytype (type): the type of every value in the column
+	"""
+	missing = False
+
+	def __init__(self, typecode, pytype, mapped=None):
+		"""Constructor.
+
+		Keyword arguments:
+		typecode (str): the ``array`` typecode of the values
+		pytype (type): the type of every value in the column
+		mapped (_Mapped): the packed values in a snapshot (default: None)
+		"""
+		self.typecode = typecode
+		self.pytype = pytype
+		self._mapped = mapped
+		self._values = array(typecode) if mapped is None else None
+
+	@property
+	def values(self):
+		if self._values is None:
+			self._values = self._mapped.array(self.typecode)
+		return self._values
+
+	def __len__(self):
+		if self._values is None:
+			return self._mapped.size // array(self.typecode).itemsize
+		return len(self._values)
+
+	def view(self):
+		"""get a NumPy array sharing the memory of the column values"""
+		if self._values is None:
+			return self._mapped.view(self.typecode)
+		return numpy.frombuffer(self._values, dtype=self.typecode)
+
+	def __iter__(self):
+		return iter(self.values)
+
+	def append(self, value):
+		"""add ``value`` to the column
+
+		Returns:
+		bool: False if the column can't store ``value``
+		"""
+		if type(value) is not self.pytype:
+			return False
+		self.values.append(value)
+		return True
+
+	def extend(self, other):
+		"""add the values of the column ``other``, which has the same type"""
+		self.values.extend(other.values)
+
+	def extend_values(self, values):
+		"""add every value in the list ``values``
+
+		Returns:
+		bool: False, without adding any values, if the column can't store them all
+		"""
+		pytype = self.pytype
+		if any(type(value) is not pytype for value in values):
+			return False
+		self.values.extend(values)
+		return True
+
+	def set(self, pos, value):
+		"""replace the value in row position ``pos``
+
+		Returns:
+		bool: False if the column can't store ``value``
+		"""
+		if type(value) is not self.pytype:
+			return False
+		self.values[pos] = value
+		return True
+
+	def take(self, positions):
+		"""get a new column of the values in ascending row ``positions``"""
+		col = copy.copy(self)
+		values = self.values
+		col._mapped = None
+		col._values = array(self.typecode, (values[pos] for pos in positions))
+		return col
+
+	def getter(self):
+		"""get a function which returns the value of the column in a row position"""
+		return self.values.__getitem__
+
+	def masker(self, pred):
+		"""get a function which evaluates ``pred`` as a boolean mask over a block of rows
+
+		The values are viewed again for each block, as appending to the
+		column can move them while a query is still being read.
+
+		Returns:
+		function: accepts a start and stop row position, or None if ``pred`` can't be evaluated as a mask
+		"""
+		view = self.view
+		if pred.op in _mask_ops:
+			if type(pred.value) not in _mask_types:
+				return None
+			op, value = _mask_ops[pred.op], pred.value
+			return lambda start, stop: op(view()[start:stop], value)
+
+		if pred.op in ('isin', 'notin'):
+			# strings and None are never equal to a number
+			if any(type(value) not in _mask_types and not isinstance(value, basestring) and value is not None for value in pred.value):
+				return None
+			values = [value for value in pred.value if type(value) in _mask_types]
+			invert = pred.op == 'notin'
+			return lambda start, stop: numpy.in1d(view()[start:stop], values, invert=invert)
+		return None
+
+class _BoolColumn(_ArrayColumn):
+	"""a column of ``bool`` values packed into an ``array.array`` of bytes"""
+	def __init__(self, mapped=None):
+		_ArrayColumn.__init__(self, 'b', bool, mapped)
+
+	def __iter__(self):
+		return (value == 1 for value in self.values)
+
+	def getter(self):
+		"""get a function which returns the value of the column in a row position"""
+		values = self.values
+		return lambda pos: values[pos] == 1
+
+class _DictColumn(object):
+	"""a column of strings stored as codes into a list of the distinct strings
+
+	A column reloaded from a snapshot keeps its codes and values in the
+	snapshot until they are first read.
+
+	Attributes:
+		codes (array): the code of the value in each row
+		values (list): the distinct values in the column
+		pytype (type): the type of every value in the column
+	"""
+	missing = False
+
+	def __init__(self, pytype, mapped=None, mapped_values=None):
+		"""Constructor.
+
+		Keyword arguments:
+		pytype (type): the type of every value in the column
+		mapped (_Mapped): the packed codes in a snapshot (default: None)
+		mapped_values (_Mapped): the JSON encoded distinct values in a snapshot (default: None)
+		"""
+		self.pytype = pytype
+		self._mapped = mapped
+		self._mapped_values = mapped_values
+		self._codes = array('i') if mapped is None else None
+		self._values = [] if mapped is None else None
+		self._lookup_values = {} if mapped is None else None
+
+	@property
+	def codes(self):
+		if self._codes is None:
+			self._codes = self._mapped.array('i')
+		return self._codes
+
+	@property
+	def values(self):
+		if self._values is None:
+			self._values = self._mapped_values.json()
+			if self.pytype is str:
+				self._values = [value.encode('utf-8') for value in self._values]
+		return self._values
+
+	@property
+	def _lookup(self):
+		if self._lookup_values is None:
+			self._lookup_values = dict((value, code) for code, value in enumerate(self.values))
+		return self._lookup_values
+
+	def __len__(self):
+		if self._codes is None:
+			return self._mapped.size // array('i').itemsize
+		return len(self._codes)
+
+	def __iter__(self):
+		values = self.values
+		return (values[code] for code in self.codes)
+
+	def append(self, value):
+		"""add ``value`` to the column
+
+		Returns:
+		bool: False if the column can't store ``value``
+		"""
+		if type(value) is not self.pytype:
+			return False
+		code = self._lookup.get(value)
+		if code is None:
+			code = self._lookup[value] = len(self.values)
+			self.values.append(value)
+		self.codes.append(code)
+		return True
+
+	def extend(self, other):
+		"""add the values of the column ``other``, which has the same type"""
+		lookup, values = self._lookup, self.values
+		mapping = []
+		for value in other.values:
+			code = lookup.get(value)
+			if code is None:
+				code = lookup[value] = len(values)
+				values.append(value)
+			mapping.append(code)
+		self.codes.extend(array('i', (mapping[code] for code in other.codes)))
+
+	def extend_values(self, values):
+		"""add every value in the list ``values``
+
+		Returns:
+		bool: False, without adding any values, if the column can't store them all
+		"""
+		pytype = self.pytype
+		if any(type(value) is not pytype for value in values):
+			return False
+		for value in values:
+			self.append(value)
+		return True
+
+	def set(self, pos, value):
+		"""replace the value in row position ``pos``
+
+		Returns:
+		bool: False if the column can't store ``value``
+		"""
+		if type(value) is not self.pytype:
+			return False
+		code = self._lookup.get(value)
+		if code is None:
+			code = self._lookup[value] = len(self.values)
+			self.values.append(value)
+		self.codes[pos] = code
+		return True
+
+	def take(self, positions):
+		"""get a new column of the values in ascending row ``positions``"""
+		col = _DictColumn(self.pytype)
+		codes = self.codes
+		col._values = list(self.values)
+		col._lookup_values = dict(self._lookup)
+		col._codes = array('i', (codes[pos] for pos in positions))
+		return col
+
+	def getter(self):
+		"""get a function which returns the value of the column in a row position"""
+		values, codes = self.values, self.codes
+		return lambda pos: values[codes[pos]]
+
+	def filter(self, test):
+		"""get a function which applies ``test`` to the value in a row position
+
+		``test`` is only evaluated once for each distinct value in the column.
+		"""
+		passing = frozenset(code for code, value in enumerate(self.values) if test(value))
+		codes = self.codes
+		return lambda pos: codes[pos] in passing
+
+	def masker(self, pred):
+		"""get a function which evaluates ``pred`` as a boolean mask over a block of rows
+
+		``pred`` is only evaluated once for each distinct value in the column,
+		and the mask is found by looking up the result for each row's code.
+		The codes are viewed again for each block, and values added since
+		the last block are tested, as appending to the column can move the
+		codes while a query is still being read.
+
+		Returns:
+		function: accepts a start and stop row position
+		"""
+		tested = [numpy.zeros(0, dtype=bool)]
+		def mask(start, stop):
+			values = self.values
+			passing = tested[0]
+			if len(passing) < len(values):
+				added = numpy.fromiter((bool(pred.test(value)) for value in values[len(passing):]), dtype=bool, count=len(values) - len(passing))
+				passing = tested[0] = numpy.concatenate((passing, added))
+			view = self._mapped.view('i') if self._codes is None else numpy.frombuffer(self._codes, dtype='i')
+			return passing[view[start:stop]]
+		return mask
+
+class _ListColumn(object):
+	"""a column of values of any type stored in a list
+
+	A column reloaded from a snapshot keeps its values in the snapshot
+	until they are first read.
+
+	Attributes:
+		values (list): the column values, ``_MISSING`` where a row doesn't contain the column
+		missing (bool): True if any row doesn't contain the column
+	"""
+	def __init__(self, values=None, mapped=None, length=0, missing=False):
+		"""Constructor.
+
+		Keyword arguments:
+		values (list): the column values (default: an empty list)
+		mapped (_Mapped): the JSON encoded values in a snapshot, used instead of ``values`` (default: None)
+		length (int): the number of values in ``mapped``
+		missing (bool): True if any of the values in ``mapped`` are ``_MISSING``
+		"""
+		self._mapped = mapped
+		self._length = length
+		if mapped is None:
+			self._values = values if values is not None else []
+			self.missing = _MISSING in self._values
+		else:
+			self._values = None
+			self.missing = missing
+
+	@property
+	def values(self):
+		if self._values is None:
+			encoded = self._mapped.json()
+			self._values = encoded['values']
+			for pos in encoded['missing']:
+				self._values[pos] = _MISSING
+		return self._values
+
+	def __len__(self):
+		if self._values is None:
+			return self._length
+		return len(self._values)
+
+	def __iter__(self):
+		return iter(self.values)
+
+	def append(self, value):
+		"""add ``value`` to the column
+
+		Returns:
+		bool: always True
+		"""
+		if value is _MISSING:
+			self.missing = True
+		self.values.append(value)
+		return True
+
+	def extend(self, other):
+		"""add the values of the column ``other``"""
+		self.missing = self.missing or other.missing
+		self.values.extend(other.values)
+
+	def extend_values(self, values):
+		"""add every value in the list ``values``
+
+		Returns:
+		bool: always True
+		"""
+		for value in values:
+			self.append(value)
+		return True
+
+	def set(self, pos, value):
+		"""replace the value in row position ``pos``
+
+		Returns:
+		bool: always True
+		"""
+		if value is _MISSING:
+			self.missing = True
+		self.values[pos] = value
+		return True
+
+	def take(self, positions):
+		"""get a new column of the values in ascending row ``positions``"""
+		values = self.values
+		return _ListColumn([values[pos] for pos in positions])
+
+	def getter(self):
+		"""get a function which returns the value of the column in a row position"""
+		return self.values.__getitem__
+
+	def masker(self, pred):
+		"""values of mixed types are always tested one row at a time"""
+		return None
+
+# Column storage for each of the value types found in the data format
+_column_types = {
+	'int': lambda: _ArrayColumn('l', int),
+	'float': lambda: _ArrayColumn('d', float),
+	'bool': _BoolColumn,
+	'str': lambda: _DictColumn(str),
+	'unicode': lambda: _DictColumn(unicode),
+}
+
+class _Expression(object):
+	"""a filter expression which can be combined with others using ``&``, ``|`` and ``~``
+
+	Calling the expression with a row dictionary evaluates it, so it can be
+	used like any ``where`` function.
+	"""
+	def __and__(self, other):
+		return _And(self, other)
+
+	def __or__(self, other):
+		return _Or(self, other)
+
+	def __invert__(self):
+		return _Not(self)
+
+class _Predicate(_Expression):
+	"""a test applied to the value of a single column
+
+	Attributes:
+		key (str): the name of the column tested
+		op (str): the name of the comparison, a key of ``_predicate_tests``
+		value (object): the comparative value
+		operand (object): the comparative value prepared for testing, e.g. a frozenset for ``isin``
+		test (function): a function which returns a boolean and accepts a column value
+	"""
+	def __init__(self, key, op, value):
+		self.key = key
+		self.op = op
+		self.value = value
+		self.operand = _predicate_operands.get(op, _identity)(value)
+		self.test = _predicate_tests[op](self.operand)
+
+	def __call__(self, item):
+		return self.test(item[self.key])
+
+	def __reduce__(self):
+		# the test is rebuilt when unpickled so predicates can be sent to worker processes
+		return (_Predicate, (self.key, self.op, self.value))
+
+	def describe(self):
+		return '%s %s %r' % (self.key, self.op, self.value)
+
+class _And(_Expression):
+	"""true where every one of ``parts`` is true"""
+	def __init__(self, *parts):
+		self.parts = []
+		for part in parts:
+			self.parts.extend(part.parts if isinstance(part, _And) else [part])
+
+	def __call__(self, item):
+		return all(part(item) for part in self.parts)
+
+	def describe(self):
+		return ' and '.join(_describe(part) for part in self.parts)
+
+class _Or(_Expression):
+	"""true where any of ``parts`` is true"""
+	def __init__(self, *parts):
+		self.parts = []
+		for part in parts:
+			self.parts.extend(part.parts if isinstance(part, _Or) else [part])
+
+	def __call__(self, item):
+		return any(part(item) for part in self.parts)
+
+	def describe(self):
+		return '(%s)' % ' or '.join(_describe(part) for part in self.parts)
+
+class _Not(_Expression):
+	"""true where ``expr`` is false"""
+	def __init__(self, expr):
+		self.expr = expr
+
+	def __call__(self, item):
+		return not self.expr(item)
+
+	def describe(self):
+		return 'not (%s)' % _describe(self.expr)
+
+class Column(object):
+	"""a reference to a column which builds filter expressions
+
+	Comparing the column with a value builds an expression which can be
+	passed to ``Table.where`` and combined with other expressions.  As ``&``
+	and ``|`` bind more tightly than comparisons, comparisons need
+	brackets when they are combined:
+
+		>>>tbl.where((col('class_id') > 1) & col('name').isin(['Steve', 'Penny']))
+
+	Attributes:
+		name (str): the name of the column
+	"""
+	def __init__(self, name):
+		self.name = name
+
+	def __eq__(self, value):
+		return _Predicate(self.name, 'eq', value)
+
+	def __ne__(self, value):
+		return _Predicate(self.name, 'ne', value)
+
+	def __gt__(self, value):
+		return _Predicate(self.name, 'gt', value)
+
+	def __lt__(self, value):
+		return _Predicate(self.name, 'lt', value)
+
+	def __ge__(self, value):
+		return _Predicate(self.name, 'ge', value)
+
+	def __le__(self, value):
+		return _Predicate(self.name, 'le', value)
+
+	def isin(self, values):
+		return _Predicate(self.name, 'isin', values)
+
+	def notin(self, values):
+		return _Predicate(self.name, 'notin', values)
+
+	def like(self, search_expr):
+		return _Predicate(self.name, 'like', search_expr)
+
+	def notlike(self, search_expr):
+		return _Predicate(self.name, 'notlike', search_expr)
+
+def col(name):
+	"""get a reference to column ``name`` for building filter expressions
+
+	Returns:
+	Column: the column reference
+	"""
+	return Column(name)
+
+class _LikePattern(object):
+	"""a regular expression prepared for testing many strings
+
+	The pattern is parsed to find the literal text every match must
+	contain, so most strings can be rejected with a substring test before
+	running the regular expression.  Patterns which are only literal text
+	never run the regular expression, and patterns anchored with ``^`` are
+	matched at the start of the string rather than searched.
+
+	Attributes:
+		pattern (str): the regular expression
+		anchored (bool): True if the pattern only matches at the start of a string
+		literals (list): strings which every matching string contains
+		prefix (str): a string which every matching string starts with if the pattern is anchored
+		matches (function): accepts a string and returns whether the pattern matches it
+	"""
+	def __init__(self, pattern):
+		self.pattern = pattern
+		exp = re.compile(pattern)
+		self.anchored, self.prefix, self.literals, pure = _pattern_literals(pattern)
+
+		if pure:
+			literal = ''.join(self.literals)
+			self.matches = (lambda s: s.startswith(literal)) if self.anchored else (lambda s: literal in s)
+		elif self.anchored:
+			match, prefix = exp.match, self.prefix
+			self.matches = (lambda s: s.startswith(prefix) and match(s) is not None) if prefix else (lambda s: match(s) is not None)
+		elif self.literals:
+			search, literal = exp.search, max(self.literals, key=len)
+			self.matches = lambda s: literal in s and search(s) is not None
+		else:
+			search = exp.search
+			self.matches = lambda s: search(s) is not None
+
+def _literal_text(codes):
+	"""get the text of a run of literal character codes, or '' if it isn't ASCII as values are converted with str()"""
+	try:
+		return str(u''.join(unichr(c) for c in codes))
+	except UnicodeEncodeError:
+		return ''
+
+def _pattern_literals(pattern):
+	"""find the literal text required by the regular expression ``pattern``
+
+	Returns:
+	tuple: whether the pattern is anchored at the start, the literal prefix of an anchored pattern,
+	the literal strings every match contains and whether the pattern is only literal text
+	"""
+	parsed = sre_parse.parse(pattern)
+	flags = parsed.pattern.flags
+	items = list(parsed)
+	at = items[0] if items else None
+	anchored = at == (sre_constants.AT, sre_constants.AT_BEGINNING_STRING) or at == (sre_constants.AT, sre_constants.AT_BEGINNING) and not flags & re.MULTILINE
+	if anchored:
+		items = items[1:]
+	if flags & re.IGNORECASE:
+		return anchored, '', [], False
+
+	literals, run = [], []
+	def walk(items):
+		for op, av in items + [(None, None)]:
+			if op == sre_constants.LITERAL:
+				run.append(av)
+				continue
+			literals.append(_literal_text(run))
+			del run[:]
+			if op == sre_constants.SUBPATTERN:
+				walk(list(av[-1]))
+			elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+				walk(list(av[2]))
+	walk(items)
+
+	pure = all(op == sre_constants.LITERAL for op, av in items)
+	prefix = literals[0] if anchored else ''
+	literals = [literal for literal in literals if literal]
+	# literal text which can't be tested with str() still needs the regular expression
+	pure = pure and (not items or bool(literals))
+	return anchored, prefix, literals, pure
+
+# Prepared like patterns, shared between queries
+_like_patterns = {}
+_LIKE_CACHE_SIZE = 256
+
+def _like_pattern(pattern):
+	"""get the prepared ``_LikePattern`` of the regular expression ``pattern``"""
+	res = _like_patterns.get(pattern)
+	if res is None:
+		if len(_like_patterns) >= _LIKE_CACHE_SIZE:
+			_like_patterns.clear()
+		res = _like_patterns[pattern] = _LikePattern(pattern)
+	return res
+
+def _identity(value):
+	return value
+
+def _value_set(values):
+	"""get a frozenset of ``values`` for membership tests, or a tuple if they can't be hashed"""
+	try:
+		return frozenset(values)
+	except TypeError:
+		return tuple(values)
+
+def _member_test(values, negate):
+	"""get a test of whether a value is in the prepared ``values``, looking unhashable values up in a tuple of them"""
+	items = tuple(values)
+	def test(v):
+		try:
+			found = v in values
+		except TypeError:
+			found = v in items
+		return found != negate
+	return test
+
+# Functions which prepare the comparative value of each predicate comparison, the identity if not listed
+_predicate_operands = {
+	'isin': _value_set,
+	'notin': _value_set,
+	'like': _like_pattern,
+	'notlike': _like_pattern,
+}
+
+# Functions which build the test for each predicate comparison from its prepared comparative value
+_predicate_tests = {
+	'eq': lambda value: lambda v: v == value,
+	'ne': lambda value: lambda v: v != value,
+	'gt': lambda value: lambda v: v > value,
+	'lt': lambda value: lambda v: v < value,
+	'ge': lambda value: lambda v: v >= value,
+	'le': lambda value: lambda v: v <= value,
+	'isin': lambda values: _member_test(values, False),
+	'notin': lambda values: _member_test(values, True),
+	'like': lambda pattern: lambda v: pattern.matches(str(v)),
+	'notlike': lambda pattern: lambda v: not pattern.matches(str(v)),
+}
+
+# Python expressions testing each predicate comparison against a row dictionary ``item``, for compiled filters
+_predicate_code = {
+	'eq': 'item[%(key)s] == %(value)s',
+	'ne': 'item[%(key)s] != %(value)s',
+	'gt': 'item[%(key)s] > %(value)s',
+	'lt': 'item[%(key)s] < %(value)s',
+	'ge': 'item[%(key)s] >= %(value)s',
+	'le': 'item[%(key)s] <= %(value)s',
+	'isin': 'item[%(key)s] in %(value)s',
+	'notin': 'item[%(key)s] not in %(value)s',
+	'like': '%(value)s.matches(str(item[%(key)s]))',
+	'notlike': 'not %(value)s.matches(str(item[%(key)s]))',
+}
+
+# Compiled filter functions by the shape of their expression
+_filter_cache = {}
+_FILTER_CACHE_SIZE = 256
+
+def _compile_filter(src, predicates):
+	"""compile a function which lazily filters rows by every expression in ``predicates`` in a single pass
+
+	The expressions are combined into the condition of a single generated
+	generator function.  Comparisons against row dictionaries are written
+	inline and anything else is called through a function.  The column
+	names, values and functions are passed as arguments, so queries with
+	the same shape share the compiled function.
+
+	Keyword arguments:
+	src (object): query access to the rows which will be filtered
+	predicates (list): expressions or functions which return a boolean and accept a dict param
+
+	Returns:
+	function: accepts an iterator of rows and returns an iterator over the rows for which every predicate is true
+	"""
+	args = []
+	def arg(value):
+		args.append(value)
+		return 'a%d' % (len(args) - 1)
+
+	members = []
+	def emit(expr, fallback=False):
+		if isinstance(expr, _Predicate):
+			if src.inline:
+				operand = expr.operand
+				if expr.op in ('isin', 'notin'):
+					members.append(expr)
+					if fallback:
+						operand = tuple(operand)
+				return _predicate_code[expr.op] % {'key': arg(expr.key), 'value': arg(operand)}
+			return '%s(item)' % arg(src.filter(expr.key, expr.test))
+		if isinstance(expr, _And):
+			return '(%s)' % ' and '.join(emit(part, fallback) for part in expr.parts)
+		if isinstance(expr, _Or):
+			return '(%s)' % ' or '.join(emit(part, fallback) for part in expr.parts)
+		if isinstance(expr, _Not):
+			return '(not %s)' % emit(expr.expr, fallback)
+		return '%s(item)' % arg(src.wrap(expr))
+
+	condition = ' and '.join(emit(expr) for expr in predicates)
+	body = '\t\tif %s:\n\t\t\tyield item\n' % condition
+	if members:
+		# unhashable values can't be looked up in the frozensets of isin and notin, so those rows are tested again against tuples of the values
+		fallback = ' and '.join(emit(expr, True) for expr in predicates)
+		body = '\t\ttry:\n\t\t\tmatch = %s\n\t\texcept TypeError:\n\t\t\tmatch = %s\n\t\tif match:\n\t\t\tyield item\n' % (condition, fallback)
+	func = _filter_cache.get(body)
+	if func is None:
+		source = 'def _filter(rows, %s):\n\tfor item in rows:\n%s' % (', '.join('a%d' % i for i in range(len(args))), body)
+		namespace = {}
+		exec compile(source, '<filter>', 'exec') in namespace
+		if len(_filter_cache) >= _FILTER_CACHE_SIZE:
+			_filter_cache.clear()
+		func = _filter_cache[body] = namespace['_filter']
+	return lambda rows: func(rows, *args)
+
+def _describe(value):
+	"""describe a predicate or an operation argument for an explained query plan"""
+	if isinstance(value, _Expression):
+		return value.describe()
+	if callable(value):
+		return 'where %s' % getattr(value, '__name__', repr(value))
+	return str(value)
+
+def _insert_position(positions, pos):
+	"""add ``pos`` to the ascending list ``positions``"""
+	if not positions or pos > positions[-1]:
+		positions.append(pos)
+	else:
+		positions.insert(bisect_left(positions, pos), pos)
+
+def _remove_position(positions, key, pos):
+	"""remove ``pos`` from the ascending list of positions of ``key`` in the dict ``positions``"""
+	matches = positions[key]
+	del matches[bisect_left(matches, pos)]
+	if not matches:
+		del positions[key]
+
+def _remap_positions(positions, mapping):
+	"""get a copy of a dict of ascending position lists with the positions moved to their new ``mapping``, -1 if deleted"""
+	res = defaultdict(list)
+	for key, matches in positions.iteritems():
+		moved = [mapping[pos] for pos in matches if mapping[pos] >= 0]
+		if moved:
+			res[key] = moved
+	return res
+
+class _HashIndex(object):
+	"""the row positions of each value in a column, for equality lookups
+
+	Attributes:
+		positions (dict): the ascending row positions of each value
+	"""
+	kind = 'hash'
+	ops = ('eq', 'isin')
+	exact = True
+
+	def __init__(self, values):
+		"""Constructor. Indexes ``values``
+
+		Keyword arguments:
+		values (iterator): the value of the column in each row position, ``_MISSING`` if the row doesn't contain the column
+		"""
+		self.positions = defaultdict(list)
+		for pos, value in enumerate(values):
+			if value is not _MISSING:
+				self.positions[value].append(pos)
+
+	def add(self, pos, value):
+		"""index ``value`` in row position ``pos``"""
+		_insert_position(self.positions[value], pos)
+
+	def remove(self, pos, value):
+		"""remove ``value`` in row position ``pos`` from the index"""
+		_remove_position(self.positions, value, pos)
+
+	def remap(self, mapping):
+		"""move the row positions after rows are deleted
+
+		Keyword arguments:
+		mapping (array): the new position of each row position, -1 if it was deleted
+		"""
+		self.positions = _remap_positions(self.positions, mapping)
+
+	def lookup(self, pred):
+		"""get the ascending row positions matching ``pred``"""
+		if pred.op == 'eq':
+			return self.positions.get(pred.value, [])
+		matches = [self.positions[value] for value in set(pred.value) if value in self.positions]
+		if len(matches) == 1:
+			return matches[0]
+		return sorted(pos for positions in matches for pos in positions)
+
+	def usable(self, pred):
+		"""determine if ``pred`` can be answered by the index"""
+		try:
+			if pred.op == 'eq':
+				hash(pred.value)
+			else:
+				set(pred.value)
+			return True
+		except TypeError:
+			return False
+
+class _SortedIndex(object):
+	"""the values of a column in sorted order along with their row positions, for range lookups
+
+	Attributes:
+		keys (list): the sorted column values
+		positions (array): the row position of each value in ``keys``
+	"""
+	kind = 'sorted'
+	ops = ('gt', 'lt', 'ge', 'le')
+	exact = True
+
+	def __init__(self, values):
+		"""Constructor. Indexes ``values``
+
+		Keyword arguments:
+		values (iterator): the value of the column in each row position, ``_MISSING`` if the row doesn't contain the column
+		"""
+		pairs = sorted((value, pos) for pos, value in enumerate(values) if value is not _MISSING)
+		self.keys = [value for value, pos in pairs]
+		self.positions = array('l', (pos for value, pos in pairs))
+
+	def _find(self, pos, value):
+		"""get where (``value``, ``pos``) is, or belongs, in the sorted keys and positions"""
+		lo, hi = bisect_left(self.keys, value), bisect_right(self.keys, value)
+		return lo + bisect_left(self.positions[lo:hi], pos)
+
+	def add(self, pos, value):
+		"""index ``value`` in row position ``pos``"""
+		i = self._find(pos, value)
+		self.keys.insert(i, value)
+		self.positions.insert(i, pos)
+
+	def remove(self, pos, value):
+		"""remove ``value`` in row position ``pos`` from the index"""
+		i = self._find(pos, value)
+		del self.keys[i]
+		del self.positions[i]
+
+	def remap(self, mapping):
+		"""move the row positions after rows are deleted
+
+		Keyword arguments:
+		mapping (array): the new position of each row position, -1 if it was deleted
+		"""
+		pairs = [(value, mapping[pos]) for value, pos in zip(self.keys, self.positions) if mapping[pos] >= 0]
+		self.keys = [value for value, pos in pairs]
+		self.positions = array('l', (pos for value, pos in pairs))
+
+	def lookup(self, pred):
+		"""get the ascending row positions matching ``pred``"""
+		if pred.op == 'gt':
+			return sorted(self.positions[bisect_right(self.keys, pred.value):])
+		if pred.op == 'ge':
+			return sorted(self.positions[bisect_left(self.keys, pred.value):])
+		if pred.op == 'le':
+			return sorted(self.positions[:bisect_right(self.keys, pred.value)])
+		return sorted(self.positions[:bisect_left(self.keys, pred.value)])
+
+	def usable(self, pred):
+		"""determine if ``pred`` can be answered by the index"""
+		return True
+
+class _NgramIndex(object):
+	"""the row positions of the strings containing each 3 character substring, for ``like`` searches
+
+	The index finds the rows containing every 3 character substring of the
+	literal text required by a pattern.  These are a superset of the rows
+	matching the pattern, so the pattern is still tested on each of them.
+
+	Attributes:
+		positions (dict): the ascending row positions of the strings containing each substring
+	"""
+	kind = 'ngram'
+	ops = ('like',)
+	exact = False
+	N = 3
+
+	def __init__(self, values):
+		"""Constructor. Indexes ``values``
+
+		Keyword arguments:
+		values (iterator): the value of the column in each row position, ``_MISSING`` if the row doesn't contain the column
+		"""
+		self.positions = defaultdict(list)
+		for pos, value in enumerate(values):
+			if value is not _MISSING:
+				for gram in self._value_grams(value):
+					self.positions[gram].append(pos)
+
+	def _value_grams(self, value):
+		"""get the 3 character substrings of ``value``"""
+		n = self.N
+		# UTF-8 contains the same bytes for the ASCII text of a pattern
+		text = value.encode('utf-8') if isinstance(value, unicode) else str(value)
+		return set(text[i:i + n] for i in xrange(len(text) - n + 1))
+
+	def add(self, pos, value):
+		"""index ``value`` in row position ``pos``"""
+		for gram in self._value_grams(value):
+			_insert_position(self.positions[gram], pos)
+
+	def remove(self, pos, value):
+		"""remove ``value`` in row position ``pos`` from the index"""
+		for gram in self._value_grams(value):
+			_remove_position(self.positions, gram, pos)
+
+	def remap(self, mapping):
+		"""move the row positions after rows are deleted
+
+		Keyword arguments:
+		mapping (array): the new position of each row position, -1 if it was deleted
+		"""
+		self.positions = _remap_positions(self.positions, mapping)
+
+	def _grams(self, pred):
+		n = self.N
+		return set(literal[i:i + n] for literal in pred.operand.literals for i in xrange(len(literal) - n + 1))
+
+	def lookup(self, pred):
+		"""get the ascending positions of the rows which may match ``pred``"""
+		matches = sorted((self.positions.get(gram, []) for gram in self._grams(pred)), key=len)
+		candidates = set(matches[0])
+		for positions in matches[1:]:
+			if not candidates:
+				break
+			candidates.intersection_update(positions)
+		return sorted(candidates)
+
+	def usable(self, pred):
+		"""determine if ``pred`` requires literal text long enough to look up"""
+		return len(self._grams(pred)) > 0
+
+# Index types by the name passed to Table.create_index
+_index_types = {'hash': _HashIndex, 'sorted': _SortedIndex, 'ngram': _NgramIndex}
+
+class _RowList(object):
+	"""query access to rows stored as a list of dictionaries
+
+	Attributes:
+		data (list): the rows
+	"""
+	indexable = True
+	inline = True
+
+	def __init__(self, data):
+		self.data = data
+
+	def __len__(self):
+		return len(self.data)
+
+	def describe(self):
+		"""describe the rows for an explained query plan"""
+		return '%d rows' % len(self.data)
+
+	def refs(self):
+		"""get an iterator over the rows"""
+		return iter(self.data)
+
+	def project(self, columns):
+		"""get query access to the rows which only needs ``columns``, the rows are shared rather than copied"""
+		return self
+
+	def refs_at(self, positions):
+		"""get an iterator over the rows in ``positions``"""
+		data = self.data
+		return (data[pos] for pos in positions)
+
+	def column_values(self, key):
+		"""get an iterator over the value of column ``key`` in each row, ``_MISSING`` if the row doesn't contain it"""
+		return (item.get(key, _MISSING) for item in self.data)
+
+	def scan(self, predicates):
+		"""get an iterator over the rows along with the ``predicates`` which still need to be applied"""
+		return self.refs(), predicates
+
+	def getter(self, key):
+		"""get a function which returns the value of column ``key`` of a row"""
+		return itemgetter(key)
+
+	def contains(self, key):
+		"""get a function which tests if a row contains column ``key``"""
+		return lambda item: key in item
+
+	def filter(self, key, test):
+		"""get a function which applies ``test`` to the value of column ``key`` of a row"""
+		return lambda item: test(item[key])
+
+	def wrap(self, func):
+		"""get a function which applies ``func`` to the dictionary of a row"""
+		return func
+
+	def row(self, ref):
+		"""get the row dictionary of a row"""
+		return ref
+
+	def materialize(self, refs, columns=None):
+		"""get a list of the row dictionaries of ``refs``
+
+		Keyword arguments:
+		refs (iterator): rows
+		columns (list): only include these columns in the rows (default: all columns)
+		"""
+		return list(self.iter_rows(refs, columns))
+
+	def iter_rows(self, refs, columns=None):
+		"""get an iterator over the row dictionaries of ``refs``
+
+		Keyword arguments:
+		refs (iterator): rows
+		columns (list): only include these columns in the rows (default: all columns)
+		"""
+		if columns:
+			return ({i:item[i] for i in item if i in columns} for item in refs)
+		return refs
+
+class _JsonScan(_RowList):
+	"""query access to the rows of a file containing a JSON object on each line
+
+	The file is read a line at a time each time the rows are iterated.
+
+	Attributes:
+		file_name (str): the file containing the rows
+		start (int): the byte offset of the first line to read
+		end (int): read the lines which start before this byte offset (default: the end of the file)
+	"""
+	indexable = False
+
+	def __init__(self, file_name, start=0, end=None, columns=None):
+		self.file_name = file_name
+		self.start = start
+		self.end = end
+		self.columns = columns
+
+	def describe(self):
+		"""describe the rows for an explained query plan"""
+		if self.columns is not None:
+			return '%s keeping %s' % (self.file_name, ', '.join(sorted(self.columns)))
+		return self.file_name
+
+	def project(self, columns):
+		"""get query access to the file which only keeps ``columns`` of each row as it is read"""
+		return _JsonScan(self.file_name, self.start, self.end, columns)
+
+	def refs(self):
+		"""get an iterator which reads the rows from the file"""
+		columns = self.columns
+		with open(self.file_name, 'rb') as f:
+			for line in self._lines(f):
+				if line.strip():
+					row = json.loads(line)
+					if columns is not None:
+						row = dict((key, row[key]) for key in columns if key in row)
+					yield row
+
+	def _lines(self, f):
+		"""get an iterator over the lines of ``f`` between the start and end offsets"""
+		if self.start == 0 and self.end is None:
+			return f
+		return self._range_lines(f)
+
+	def _range_lines(self, f):
+		f.seek(self.start)
+		pos = self.start
+		while self.end is None or pos < self.end:
+			line = f.readline()
+			if not line:
+				break
+			pos += len(line)
+			yield line
+
+class _ColumnStore(object):
+	"""rows stored as one typed column per key
+
+	``int``, ``float`` and ``bool`` columns are packed into arrays and string
+	columns are dictionary encoded, based on the type of the first value in
+	each column.  A column falls back to a plain list if a row doesn't fit.
+	Rows are referenced by their position when querying and are only built
+	into dictionaries when they are returned.
+
+	Attributes:
+		columns (dict): the column storage for each key
+		names (list): the keys in the order they were first seen
+		data_format (dict): the type name of each column
+	"""
+	def __init__(self, rows=(), data_format=None):
+		"""Constructor. Stores ``rows`` in columns
+
+		Keyword arguments:
+		rows (iterator): row dictionaries
+		data_format (dict): the type name of each column (default: the type of the first value in each column)
+		"""
+		self.columns = {}
+		self.names = []
+		self.data_format = data_format or {}
+		self._length = 0
+		for row in rows:
+			self.append(row)
+
+	@classmethod
+	def from_columns(cls, names, columns):
+		"""build a store from a list of values for each column
+
+		Keyword arguments:
+		names (list): the column names
+		columns (list): a list of values for each name, all of the same length
+		"""
+		store = cls()
+		for name, values in zip(names, columns):
+			col = _ListColumn()
+			if values:
+				col = _column_types.get(type(values[0]).__name__, _ListColumn)()
+				if not col.extend_values(values):
+					col = _ListColumn()
+					col.extend_values(values)
+			store.columns[name] = col
+			store.names.append(name)
+			store._length = len(values)
+		return store
+
+	def __len__(self):
+		return self._length
+
+	def __getitem__(self, pos):
+		if isinstance(pos, slice):
+			return self.materialize(xrange(*pos.indices(self._length)))
+		if pos < 0:
+			pos += self._length
+		if not 0 <= pos < self._length:
+			raise IndexError('row index out of range')
+		return self.row(pos)
+
+	def __iter__(self):
+		return self.iter_rows(self.refs())
+
+	def append(self, row):
+		"""add the dictionary ``row`` as a new row"""
+		n = self._length
+		columns = self.columns
+		for key, value in row.items():
+			col = columns.get(key)
+			if col is None:
+				if n == 0:
+					col = _column_types.get(self.data_format.get(key, type(value).__name__), _ListColumn)()
+				else:
+					col = _ListColumn([_MISSING] * n)
+				columns[key] = col
+				self.names.append(key)
+			if not col.append(value):
+				col = columns[key] = _ListColumn(list(col))
+				col.append(value)
+
+		if len(row) != len(columns):
+			for key in self.names:
+				col = columns[key]
+				if len(col) == n and not col.append(_MISSING):
+					col = columns[key] = _ListColumn(list(col))
+					col.append(_MISSING)
+		self._length = n + 1
+
+	def extend(self, rows):
+		"""add each row in ``rows``
+
+		Another ``_ColumnStore`` with the same columns is added a column at a time.
+
+		Keyword arguments:
+		rows (iterator): row dictionaries or a ``_ColumnStore``
+		"""
+		if isinstance(rows, _ColumnStore) and self._length == 0:
+			self.columns, self.names, self._length = dict(rows.columns), list(rows.names), rows._length
+		elif isinstance(rows, _ColumnStore) and self._same_columns(rows):
+			for key in self.names:
+				self.columns[key].extend(rows.columns[key])
+			self._length += rows._length
+		else:
+			for row in rows:
+				self.append(row)
+
+	def set(self, pos, key, value):
+		"""replace the value of column ``key`` in row position ``pos``"""
+		col = self.columns.get(key)
+		if col is None:
+			col = self.columns[key] = _ListColumn([_MISSING] * self._length)
+			self.names.append(key)
+		if not col.set(pos, value):
+			col = self.columns[key] = _ListColumn(list(col))
+			col.set(pos, value)
+
+	def take(self, positions):
+		"""get a new store of the rows in ascending row ``positions``"""
+		store = _ColumnStore(data_format=self.data_format)
+		store.names = list(self.names)
+		store.columns = dict((key, col.take(positions)) for key, col in self.columns.items())
+		store._length = len(positions)
+		return store
+
+	def _same_columns(self, other):
+		"""determine if the columns of ``other`` have the same names and storage as this store's"""
+		if set(self.names) != set(other.names):
+			return False
+		for key in self.names:
+			col, ocol = self.columns[key], other.columns[key]
+			if type(col) is not type(ocol) or getattr(col, 'pytype', None) is not getattr(ocol, 'pytype', None):
+				return False
+		return True
+
+	indexable = True
+	inline = False
+
+	def describe(self):
+		"""describe the rows for an explained query plan"""
+		return '%d rows' % self._length
+
+	def refs(self):
+		"""get an iterator over the row positions"""
+		return iter(xrange(self._length))
+
+	def refs_at(self, positions):
+		"""get an iterator over the row positions in ``positions``"""
+		return iter(positions)
+
+	def project(self, columns):
+		"""get query access to the rows which only needs ``columns``, only those columns are built into rows"""
+		return self
+
+	def column_values(self, key):
+		"""get an iterator over the value of column ``key`` in each row, ``_MISSING`` if the row doesn't contain it"""
+		col = self.columns.get(key)
+		if col is None:
+			return (_MISSING for pos in xrange(self._length))
+		return iter(col)
+
+	def scan(self, predicates):
+		"""get an iterator over the row positions along with the ``predicates`` which still need to be applied
+
+		If NumPy is available, comparisons on homogeneous columns are evaluated
+		as boolean masks over blocks of rows and the masks are combined, so
+		only the remaining predicates are applied to each row.
+
+		Keyword arguments:
+		predicates (list): ``_Predicate`` instances or functions which accept a dict param
+		"""
+		maskers, remaining = [], []
+		for pred in predicates:
+			masker = None
+			if _numpy and isinstance(pred, _Predicate):
+				col = self.columns.get(pred.key)
+				if col is not None and not col.missing and len(col) > 0:
+					masker = col.masker(pred)
+			if masker is not None:
+				maskers.append(masker)
+			else:
+				remaining.append(pred)
+
+		if not maskers:
+			return self.refs(), predicates
+		return self._masked_refs(maskers), remaining
+
+	def _masked_refs(self, maskers):
+		"""yield the row positions for which every mask is true, one block of rows at a time"""
+		for start in xrange(0, self._length, _MASK_BLOCK):
+			stop = min(start + _MASK_BLOCK, self._length)
+			mask = maskers[0](start, stop)
+			for masker in maskers[1:]:
+				mask &= masker(start, stop)
+			for pos in (numpy.flatnonzero(mask) + start).tolist():
+				yield pos
+
+	def getter(self, key):
+		"""get a function which returns the value of column ``key`` in a row position"""
+		col = self.columns.get(key)
+		if col is None or col.missing:
+			get = col.getter() if col is not None else lambda pos: _MISSING
+			def checked(pos):
+				value = get(pos)
+				if value is _MISSING:
+					raise KeyError(key)
+				return value
+			return checked
+		return col.getter()
+
+	def contains(self, key):
+		"""get a function which tests if the row in a position contains column ``key``"""
+		col = self.columns.get(key)
+		if col is None:
+			return lambda pos: False
+		get = col.getter()
+		return lambda pos: get(pos) is not _MISSING
+
+	def filter(self, key, test):
+		"""get a function which applies ``test`` to the value of column ``key`` in a row position"""
+		col = self.columns.get(key)
+		if isinstance(col, _DictColumn):
+			return col.filter(test)
+		get = self.getter(key)
+		return lambda pos: test(get(pos))
+
+	def wrap(self, func):
+		"""get a function which applies ``func`` to the dictionary built for a row position"""
+		build = self.row_builder()
+		return lambda pos: func(build(pos))
+
+	def row_builder(self, columns=None):
+		"""get a function which builds the row dictionary for a row position
+
+		Keyword arguments:
+		columns (list): only include these columns in the rows (default: all columns)
+		"""
+		getters = [(key, self.columns[key].getter()) for key in (columns or self.names) if key in self.columns]
+		def build(pos):
+			row = {}
+			for key, get in getters:
+				value = get(pos)
+				if value is not _MISSING:
+					row[key] = value
+			return row
+		return build
+
+	def row(self, pos, columns=None):
+		"""build the row dictionary for the row in position ``pos``"""
+		return self.row_builder(columns)(pos)
+
+	def iter_rows(self, refs, columns=None):
+		"""lazily build the row dictionaries for the row positions in ``refs``
+
+		Keyword arguments:
+		refs (iterator): row positions
+		columns (list): only include these columns in the rows (default: all columns)
+		"""
+		return imap(self.row_builder(columns), refs)
+
+	def materialize(self, refs, columns=None):
+		"""build a list of the row dictionaries for the row positions in ``refs``"""
+		return list(self.iter_rows(refs, columns))
+
+# Number of rows sampled to infer the type of each CSV column
+_CSV_SAMPLE = 1000
+
+# Number of CSV rows read and converted at a time
+_CSV_CHUNK = 10000
+
+def _csv_bool(value):
+	"""convert a CSV value of 'true' or 'false' to a bool"""
+	return value.lower() == 'true'
+
+def _csv_unicode(value):
+	"""decode a UTF-8 CSV value"""
+	return value.decode('utf-8')
+
+def _csv_float(value):
+	"""convert a CSV value to a float, rejecting spellings of nan and infinity which are more likely to be text"""
+	res = float(value)
+	if math.isnan(res) or math.isinf(res):
+		raise ValueError("could not convert string to float: %s" % value)
+	return res
+
+# Functions which convert a CSV value to each inferred column type
+_csv_converters = {'bool': _csv_bool, 'int': int, 'float': _csv_float, 'unicode': _csv_unicode}
+
+def _infer_csv_type(values):
+	"""infer the type of a CSV column from a sample of its values
+
+	Empty values are ignored.
+
+	Returns:
+	str: 'bool', 'int', 'float' or 'unicode'
+	"""
+	values = [value for value in values if value != '']
+	if not values:
+		return 'unicode'
+	if all(value.lower() in ('true', 'false') for value in values):
+		return 'bool'
+	for name in ('int', 'float'):
+		convert = _csv_converters[name]
+		try:
+			for value in values:
+				convert(value)
+		except ValueError:
+			continue
+		return name
+	return 'unicode'
+
+def _convert_csv_column(values, type_name):
+	"""convert the CSV values of a column to ``type_name``
+
+	The whole column is converted at once.  If that fails, each value is
+	converted by itself and values which can't be converted are kept as
+	strings.
+
+	Returns:
+	list: the converted values
+	"""
+	convert = _csv_converters[type_name]
+	if type_name == 'unicode':
+		return map(convert, values)
+	if '' not in values:
+		try:
+			return map(convert, values)
+		except ValueError:
+			pass
+
+	converted = []
+	for value in values:
+		if value == '':
+			converted.append(None)
+			continue
+		try:
+			converted.append(convert(value))
+		except ValueError:
+			converted.append(_csv_unicode(value))
+	return converted
+
+def _read_csv(file_name, chunk_size):
+	"""read a CSV file with a header line, ``chunk_size`` rows at a time
+
+	Returns:
+	iterator: (names, columns) tuples, where columns contains a list of converted values for each name
+	"""
+	with open(file_name, 'rb') as f:
+		reader = csv.reader(f)
+		names = [_csv_unicode(name) for name in next(reader, [])]
+		width = len(names)
+		if not width:
+			return
+
+		types = None
+		chunk = []
+		for row in reader:
+			if not row:
+				continue
+			if len(row) != width:
+				row = (row + [''] * width)[:width]
+			chunk.append(row)
+
+			if types is None and len(chunk) >= _CSV_SAMPLE:
+				types = [_infer_csv_type(values) for values in zip(*chunk)]
+			if len(chunk) >= chunk_size and types is not None:
+				yield names, [_convert_csv_column(values, type_name) for values, type_name in zip(zip(*chunk), types)]
+				chunk = []
+
+		if chunk:
+			if types is None:
+				types = [_infer_csv_type(values) for values in zip(*chunk)]
+			yield names, [_convert_csv_column(values, type_name) for values, type_name in zip(zip(*chunk), types)]
+
+# Snapshot files start with the magic string, then the offset and size of the JSON header
+_SNAPSHOT_MAGIC = 'TBLSNAP1'
+_snapshot_prelude = struct.Struct('<8sQQ')
+
+# Column value types by name, for reloading snapshots
+_snapshot_types = {'int': int, 'float': float, 'bool': bool, 'str': str, 'unicode': unicode}
+
+def _write_block(f, write):
+	"""write a block of column data aligned to 8 bytes
+
+	Keyword arguments:
+	f (file): the snapshot file
+	write (function): writes the block to ``f``
+
+	Returns:
+	list: the offset and size of the block
+	"""
+	f.write('\0' * (-f.tell() % 8))
+	offset = f.tell()
+	write(f)
+	return [offset, f.tell() - offset]
+
+def _write_snapshot(store, file_name, data_format):
+	"""write a ``_ColumnStore`` to a snapshot file
+
+	Each column is written as a separate block: packed values for int,
+	float and bool columns, packed codes plus the JSON encoded distinct
+	values for string columns, and JSON for any other column.  The header
+	at the end of the file describes where each block is.
+	"""
+	with open(file_name, 'wb') as f:
+		f.write('\0' * _snapshot_prelude.size)
+		columns = []
+		for name in store.names:
+			col = store.columns[name]
+			desc = {'name': name}
+			if isinstance(col, _ArrayColumn):
+				desc['kind'] = 'bool' if isinstance(col, _BoolColumn) else 'array'
+				desc['typecode'] = col.typecode
+				desc['pytype'] = col.pytype.__name__
+				desc['data'] = _write_block(f, col.values.tofile)
+			elif isinstance(col, _DictColumn):
+				desc['kind'] = 'dict'
+				desc['pytype'] = col.pytype.__name__
+				desc['data'] = _write_block(f, col.codes.tofile)
+				desc['values'] = _write_block(f, lambda f: f.write(json.dumps(col.values)))
+			else:
+				values = col.values
+				missing = [pos for pos, value in enumerate(values) if value is _MISSING] if col.missing else []
+				encoded = {'values': [None if value is _MISSING else value for value in values], 'missing': missing}
+				desc['kind'] = 'list'
+				desc['length'] = len(values)
+				desc['missing'] = col.missing
+				desc['data'] = _write_block(f, lambda f: f.write(json.dumps(encoded)))
+			columns.append(desc)
+
+		header = json.dumps({
+			'length': len(store),
+			'byteorder': sys.byteorder,
+			'itemsizes': dict((typecode, array(typecode).itemsize) for typecode in 'bild'),
+			'data_format': data_format,
+			'names': store.names,
+			'columns': columns
+		})
+		offset = f.tell()
+		f.write(header)
+		f.seek(0)
+		f.write(_snapshot_prelude.pack(_SNAPSHOT_MAGIC, offset, len(header)))
+
+def _read_snapshot(file_name):
+	"""memory map a snapshot file as a ``_ColumnStore``
+
+	Only the header is read.  Each column is read from the mapped file the
+	first time it is used.
+
+	Returns:
+	tuple: the ``_ColumnStore`` and the data format of the snapshot
+	"""
+	with open(file_name, 'rb') as f:
+		buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	if len(buf) < _snapshot_prelude.size:
+		raise ValueError("%s is not a table snapshot" % file_name)
+	magic, offset, size = _snapshot_prelude.unpack_from(buf, 0)
+	if magic != _SNAPSHOT_MAGIC:
+		raise ValueError("%s is not a table snapshot" % file_name)
+
+	header = json.loads(buf[offset:offset + size])
+	if header['byteorder'] != sys.byteorder or any(array(str(typecode)).itemsize != itemsize for typecode, itemsize in header['itemsizes'].items()):
+		raise ValueError("%s was written on an incompatible platform" % file_name)
+
+	store = _ColumnStore()
+	for desc in header['columns']:
+		mapped = _Mapped(buf, *desc['data'])
+		if desc['kind'] == 'array':
+			col = _ArrayColumn(str(desc['typecode']), _snapshot_types[desc['pytype']], mapped)
+		elif desc['kind'] == 'bool':
+			col = _BoolColumn(mapped)
+		elif desc['kind'] == 'dict':
+			col = _DictColumn(_snapshot_types[desc['pytype']], mapped, _Mapped(buf, *desc['values']))
+		else:
+			col = _ListColumn(mapped=mapped, length=desc['length'], missing=desc['missing'])
+		store.columns[desc['name']] = col
+	store.names = header['names']
+	store._length = header['length']
+	return store, header['data_format']
+
+# Number of rows serialized and written together by export
+_EXPORT_BATCH = 10000
+
+# Export formats by file extension, any other extension is exported as JSON
+_export_extensions = {'.csv': 'csv', '.bin': 'binary'}
+
+# Functions which open a file for writing or reading with each compression
+_compressions = {
+	None: open,
+	'gzip': lambda file_name, mode: gzip.open(file_name, mode, 6),
+	'bz2': bz2.BZ2File,
+}
+_compression_extensions = {'.gz': 'gzip', '.bz2': 'bz2'}
+
+# Prefix of each row in the binary row format, the size of the marshalled row
+_binary_prefix = struct.Struct('<I')
+
+def _export_format(file_name, format=None, compression=None):
+	"""get the format and compression of an exported file from its extension
+
+	Returns:
+	tuple: the format and compression names
+	"""
+	root, ext = os.path.splitext(file_name)
+	if compression is None and ext in _compression_extensions:
+		compression = _compression_extensions[ext]
+		root, ext = os.path.splitext(root)
+	if format is None:
+		format = _export_extensions.get(ext, 'json')
+	return format, compression
+
+def _csv_value(value):
+	"""convert a value to the string written to a CSV file, in a form ``load_csv`` reads back"""
+	if value is None:
+		return ''
+	if isinstance(value, bool):
+		return 'true' if value else 'false'
+	if isinstance(value, unicode):
+		return value.encode('utf-8')
+	if isinstance(value, (list, dict)):
+		return json.dumps(value)
+	return value
+
+def _serialize_json(rows, columns):
+	return ''.join('%s\n' % json.dumps(item) for item in rows)
+
+def _serialize_csv(rows, columns):
+	out = StringIO()
+	writer = csv.writer(out)
+	writer.writerows([_csv_value(item.get(col)) for col in columns] for item in rows)
+	return out.getvalue()
+
+def _serialize_binary(rows, columns):
+	out = []
+	for item in rows:
+		data = marshal.dumps(item, 2)
+		out.append(_binary_prefix.pack(len(data)))
+		out.append(data)
+	return ''.join(out)
+
+# Functions which serialize a batch of rows in each export format
+_serializers = {
+	'json': _serialize_json,
+	'csv': _serialize_csv,
+	'binary': _serialize_binary,
+}
+
+def _serialize_batch(args):
+	"""serialize a batch of exported rows, in a worker process when exporting in parallel
+
+	Keyword arguments:
+	args (tuple): the format name, the CSV columns and the rows
+
+	Returns:
+	str: the serialized rows
+	"""
+	format, columns, rows = args
+	return _serializers[format](rows, columns)
+
+def _batches(rows, size):
+	"""split an iterable of rows into lists of ``size`` rows"""
+	rows = iter(rows)
+	while True:
+		batch = list(islice(rows, size))
+		if not batch:
+			return
+		yield batch
+
+def _read_binary(f):
+	"""read the rows of a file in the binary row format
+
+	Returns:
+	generator: the rows
+	"""
+	while True:
+		prefix = f.read(_binary_prefix.size)
+		if not prefix:
+			return
+		if len(prefix) < _binary_prefix.size:
+			raise ValueError("truncated row")
+		size, = _binary_prefix.unpack(prefix)
+		data = f.read(size)
+		if len(data) < size:
+			raise ValueError("truncated row")
+		yield marshal.loads(data)
+
+def _split_file(file_name, parts):
+	"""split a file into about ``parts`` byte ranges which start and end on line boundaries
+
+	Returns:
+	list: (start, end) byte offsets
+	"""
+	size = os.path.getsize(file_name)
+	bounds = [0]
+	with open(file_name, 'rb') as f:
+		for i in range(1, parts):
+			f.seek(max(size * i // parts, bounds[-1]))
+			f.readline()
+			bounds.append(min(f.tell(), size))
+	bounds.append(size)
+	return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+def _load_chunk(args):
+	"""parse the lines of a byte range of a JSON file in a worker process
+
+	Keyword arguments:
+	args (tuple): the file name, start and end offsets and whether to store the rows as columns
+
+	Returns:
+	list or _ColumnStore: the parsed rows
+	"""
+	file_name, start, end, columnar = args
+	data = _ColumnStore() if columnar else []
+	with open(file_name, 'rb') as f:
+		for line in _JsonScan(file_name, start, end)._lines(f):
+			if not line.strip():
+				continue
+			try:
+				data.append(json.loads(line))
+			except ValueError, e:
+				raise ValueError("%s. Data: %s" % (e, line))
+	return data
+
+def _aggregate_chunk(args):
+	"""filter and partially aggregate the rows of a byte range of a JSON file in a worker process
+
+	Keyword arguments:
+	args (tuple): the file name, start and end offsets, a list of ``_Predicate`` and the (aggregate, column) specs
+
+	Returns:
+	list: the accumulator of each aggregate, combined by ``_combine_aggregates``, or None if no rows matched
+	"""
+	file_name, start, end, predicates, specs = args
+	src = _JsonScan(file_name, start, end)
+	rows = src.refs()
+	if predicates:
+		rows = _compile_filter(src, predicates)(rows)
+	order, groups = _accumulate(src, rows, specs)
+	return groups.get(None)
+
+def _combine_aggregates(specs, partials):
+	"""combine the partial aggregates returned by ``_aggregate_chunk``
+
+	Returns:
+	list: the value of each aggregate
+	"""
+	accumulators, positions = _accumulator_specs(specs)
+	res = _init_accumulators(accumulators)
+	for partial in partials:
+		if partial is not None:
+			res = [_accumulators[kind][2](acc, value) for (kind, col), acc, value in zip(accumulators, res, partial)]
+	return _finish(specs, res)
+
+def _key_columns(key):
+	"""get the list of columns in a group key which is a column name or a list of column names"""
+	if key is None:
+		return []
+	if isinstance(key, (list, tuple)):
+		return list(key)
+	return [key]
+
+def _expression_columns(expr):
+	"""get the set of columns read by a filter, or None if it is a function which may read any column"""
+	if isinstance(expr, _Predicate):
+		return set([expr.key])
+	if isinstance(expr, (_And, _Or)):
+		res = set()
+		for part in expr.parts:
+			cols = _expression_columns(part)
+			if cols is None:
+				return None
+			res |= cols
+		return res
+	if isinstance(expr, _Not):
+		return _expression_columns(expr.expr)
+	return None
+
+def _ordered_by(plan, columns):
+	"""get whether the rows produced by ``plan`` are in ascending order of ``columns``"""
+	for op in reversed(plan):
+		if op[0] in ('orderby', 'topn'):
+			reverse = op[-1]
+			return _key_columns(op[1]) == list(columns) and not any(reverse if isinstance(reverse, (list, tuple)) else [reverse])
+		if op[0] not in ('where', 'limit', 'distinct'):
+			return False
+	return False
+
+def _rows_ordered(src, columns):
+	"""get whether the rows of ``src`` are in ascending order of ``columns``, reading the rows if they are in memory"""
+	if isinstance(src, _JsonScan):
+		return False
+	key = _join_key(columns)
+	prev = _MISSING
+	for item in src.iter_rows(src.refs(), columns):
+		value = key(item)
+		if value is _MISSING or (prev is not _MISSING and value < prev):
+			return False
+		prev = value
+	return True
+
+def _projections(plan, columns):
+	"""work out the columns of the rows read by each operation of ``plan``
+
+	Working back from the selected columns, each operation adds the
+	columns it reads, aggregates replace them with the columns they
+	aggregate, and joins split them between the two joined tables.
+
+	Keyword arguments:
+	plan (list): the operations of a query
+	columns (list): the selected columns, every column if empty
+
+	Returns:
+	list: the set of columns needed from the rows read by each operation, or None if every column is needed, followed by the columns of the result
+	"""
+	needed = set(columns) if columns else None
+	res = [needed]
+	for op in reversed(plan):
+		name, args = op[0], op[1:]
+		if name == 'agg':
+			needed = set(_key_columns(args[0])) | set(col for spec, col in args[1] if col is not None)
+		elif name == 'aggregate':
+			needed = set(col for spec, col in args[0] if col is not None)
+		elif name in ('count', 'sum', 'min', 'max', 'avg', 'approx_distinct'):
+			needed = set([args[0]]) if args[0] is not None else set()
+		elif needed is None or name == 'limit':
+			pass
+		elif name == 'where':
+			cols = _expression_columns(args[0])
+			needed = None if cols is None else needed | cols
+		elif name in ('orderby', 'topn', 'distinct'):
+			needed = needed | set(_key_columns(args[0]))
+		elif name == 'join':
+			other, column, alias, right, other_column, how = args
+			prefix = alias + '.'
+			if right and how in ('semi', 'anti'):
+				needed = set()
+			elif right:
+				needed = set(key[len(prefix):] for key in needed if key.startswith(prefix))
+			else:
+				needed = set(key for key in needed if not key.startswith(prefix))
+			needed.update(column)
+		else:
+			needed = None
+		res.append(needed)
+	res.reverse()
+	return res
+
+def _key_getter(src, columns):
+	"""get a function which returns the group key of a row, a tuple if there is more than one column"""
+	if len(columns) == 1:
+		return src.getter(columns[0])
+	getters = [src.getter(col) for col in columns]
+	return lambda item: tuple(get(item) for get in getters)
+
+class _Descending(object):
+	"""wraps a value in a sort key so that it sorts in descending order"""
+	__slots__ = ('value',)
+
+	def __init__(self, value):
+		self.value = value
+
+	def __lt__(self, other):
+		return other.value < self.value
+
+	def __gt__(self, other):
+		return other.value > self.value
+
+	def __le__(self, other):
+		return other.value <= self.value
+
+	def __ge__(self, other):
+		return other.value >= self.value
+
+	def __eq__(self, other):
+		return self.value == other.value
+
+	def __ne__(self, other):
+		return self.value != other.value
+
+def _sort_key(src, key, reverse):
+	"""get the sort key function of rows ordered by ``key``
+
+	Keyword arguments:
+	src (object): query access to the table data
+	key (str or list): the column, or a list of the columns, to order by
+	reverse (bool or list): descending order, or a list of whether each column is in descending order
+
+	Returns:
+	tuple: the key function and whether to reverse the order
+	"""
+	columns = _key_columns(key)
+	directions = list(reverse) if isinstance(reverse, (list, tuple)) else [reverse] * len(columns)
+	if len(directions) != len(columns):
+		raise ValueError("orderby() got %d columns and %d directions" % (len(columns), len(directions)))
+	if len(set(directions)) <= 1:
+		return _key_getter(src, columns), bool(directions and directions[0])
+	getters = [(src.getter(col), desc) for col, desc in zip(columns, directions)]
+	return lambda item: tuple(_Descending(get(item)) if desc else get(item) for get, desc in getters), False
+
+# Number of rows orderby sorts in memory by default before spilling sorted runs to temporary files
+_SORT_BUDGET = 1000000
+
+def _spill_run(refs):
+	"""write sorted rows to a temporary file in the binary row format
+
+	Returns:
+	file: the temporary file, positioned at its start
+	"""
+	f = tempfile.TemporaryFile()
+	write = f.write
+	for data in imap(marshal.dumps, refs):
+		write(_binary_prefix.pack(len(data)))
+		write(data)
+	f.seek(0)
+	return f
+
+def _decorate_run(refs, keyfunc, descending, run):
+	"""decorate the sorted rows of a run with their sort key, run and position so runs can be merged stably
+
+	Keyword arguments:
+	refs (iterator): the sorted rows of the run
+	keyfunc (function): the sort key function of the rows
+	descending (bool): whether the rows are in descending order
+	run (int): the position of the run in the input
+	"""
+	for pos, ref in enumerate(refs):
+		key = keyfunc(ref)
+		yield (_Descending(key) if descending else key), run, pos, ref
+
+def _read_run(f):
+	"""read the rows of a spilled run and close it once they have been read"""
+	try:
+		for ref in _read_binary(f):
+			yield ref
+	finally:
+		f.close()
+
+def _external_sort(rows, keyfunc, reverse, budget):
+	"""sort ``rows`` holding at most ``budget`` rows in memory
+
+	The rows are sorted in runs of ``budget`` rows.  Each run except the
+	last is written to a temporary file and the runs are merged as the
+	sorted rows are read, so the rows are yielded as a stream.  Rows with
+	equal keys keep their order.
+
+	Keyword arguments:
+	rows (iterator): the rows to sort. Rows must be values which can be marshalled
+	keyfunc (function): the sort key function of the rows
+	reverse (bool): sort in descending order
+	budget (int): the number of rows to sort in memory
+
+	Returns:
+	iterator: the sorted rows
+	"""
+	if budget < 1:
+		raise ValueError("sort_budget must be at least 1, got %r" % (budget,))
+	rows = iter(rows)
+	runs = []
+	run = list(islice(rows, budget))
+	while True:
+		run.sort(key=keyfunc, reverse=reverse)
+		extra = next(rows, _MISSING) if len(run) == budget else _MISSING
+		if extra is _MISSING:
+			break
+		runs.append(_spill_run(run))
+		run = [extra]
+		run.extend(islice(rows, budget - 1))
+	if not runs:
+		return iter(run)
+
+	sources = [_read_run(f) for f in runs] + [iter(run)]
+	merged = heapq.merge(*[_decorate_run(refs, keyfunc, reverse, i) for i, refs in enumerate(sources)])
+	return (ref for key, i, pos, ref in merged)
+
+def _min_step(acc, value):
+	return value if acc is _MISSING or (value is not _MISSING and value < acc) else acc
+
+def _max_step(acc, value):
+	return value if acc is _MISSING or (value is not _MISSING and value > acc) else acc
+
+def _var_update(acc, values):
+	n = len(values)
+	mean = sum(values) / float(n)
+	return _var_merge(acc, (n, mean, sum((value - mean) ** 2 for value in values)))
+
+def _var_merge(acc, other):
+	# combines the running variances of two sets of values, Chan et al.
+	n = acc[0] + other[0]
+	if n == 0:
+		return acc
+	delta = other[1] - acc[1]
+	return n, acc[1] + delta * other[0] / n, acc[2] + other[2] + delta * delta * acc[0] * other[0] / n
+
+def _var_final(acc):
+	return acc[2] / acc[0] if acc[0] else None
+
+def _extreme_final(acc):
+	return None if acc is _MISSING else acc
+
+class _TDigest(object):
+	"""an approximation of the distribution of a set of values, for estimating percentiles
+
+	A merging t-digest.  Values are buffered and merged into a sorted list
+	of centroids, each the mean of a run of neighbouring values.  Centroids
+	near the ends of the distribution hold few values so extreme
+	percentiles stay accurate, and the number of centroids is bounded by
+	about ``compression`` however many values are added.
+
+	Attributes:
+		compression (int): bounds the number of centroids
+		centroids (list): (mean, count) of each centroid, in ascending order of mean
+		count (int): the number of values added
+	"""
+	_BUFFER = 10000
+
+	def __init__(self, compression=200):
+		self.compression = compression
+		self.centroids = []
+		self.count = 0
+		self.min = None
+		self.max = None
+		self._buffer = []
+
+	def extend(self, values):
+		"""add a list of values to the digest
+
+		Returns:
+		_TDigest: self
+		"""
+		self._buffer.extend(values)
+		self.count += len(values)
+		low, high = min(values), max(values)
+		if self.min is None or low < self.min:
+			self.min = low
+		if self.max is None or high > self.max:
+			self.max = high
+		if len(self._buffer) >= self._BUFFER:
+			self._compress()
+		return self
+
+	def merge(self, other):
+		"""add the values of another digest to this one
+
+		Returns:
+		_TDigest: self
+		"""
+		if other.count:
+			other._compress()
+			self._compress()
+			self.count += other.count
+			self.min = other.min if self.min is None else min(self.min, other.min)
+			self.max = other.max if self.max is None else max(self.max, other.max)
+			self._merge_centroids(sorted(self.centroids + other.centroids))
+		return self
+
+	def _k(self, q):
+		return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+	def _q(self, k):
+		if k >= self.compression / 4.0:
+			return 1.0
+		return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+	def _compress(self):
+		"""merge the buffered values into the centroids"""
+		if self._buffer:
+			self._merge_centroids(sorted(self.centroids + [(value, 1) for value in self._buffer]))
+			self._buffer = []
+
+	def _merge_centroids(self, items):
+		"""replace the centroids by merging neighbouring (mean, count) ``items``, which are in ascending order of mean"""
+		total = float(self.count)
+		centroids = []
+		mean, weight = items[0]
+		done = 0
+		limit = total * self._q(self._k(0) + 1)
+		for value, w in items[1:]:
+			if done + weight + w <= limit:
+				weight += w
+				mean += (value - mean) * float(w) / weight
+			else:
+				centroids.append((mean, weight))
+				done += weight
+				limit = total * self._q(self._k(done / total) + 1)
+				mean, weight = value, w
+		centroids.append((mean, weight))
+		self.centroids = centroids
+
+	def quantile(self, q):
+		"""estimate the value below which a fraction ``q`` of the values fall
+
+		Returns:
+		float: the estimate, or None if no values have been added
+		"""
+		self._compress()
+		centroids = self.centroids
+		if not centroids:
+			return None
+		target = q * self.count
+		# each centroid is centred on the middle of the values it holds
+		prev_pos, prev_mean = 0, self.min
+		pos = 0
+		for mean, weight in centroids:
+			centre = pos + weight / 2.0
+			if target < centre:
+				break
+			prev_pos, prev_mean = centre, mean
+			pos += weight
+		else:
+			centre, mean = self.count, self.max
+		if centre == prev_pos:
+			return mean
+		return prev_mean + (mean - prev_mean) * (target - prev_pos) / (centre - prev_pos)
+
+class _HyperLogLog(object):
+	"""an estimate of the number of distinct values in a set of values
+
+	Each value is hashed and the hash picks one of 2 ** ``precision``
+	registers, which keeps the longest run of leading zero bits seen in
+	the rest of the hash.  The registers use a few kilobytes however many
+	values are added and the estimate is typically within 1.04 / sqrt(2 **
+	``precision``) of the true count, under 1% by default.  The hash is
+	stable between processes and runs so estimates can be merged.
+
+	Attributes:
+		precision (int): the number of hash bits which select a register
+		registers (bytearray): the longest run of zeros plus one seen by each register
+	"""
+	def __init__(self, precision=14):
+		self.precision = precision
+		self.registers = bytearray(1 << precision)
+
+	@staticmethod
+	def _hash(value):
+		"""get a stable 64 bit hash of ``value``"""
+		if isinstance(value, unicode):
+			data = 's' + value.encode('utf-8')
+		elif isinstance(value, str):
+			data = 's' + value
+		else:
+			data = 'r' + repr(value)
+		return _hll_hash.unpack_from(hashlib.md5(data).digest())[0]
+
+	def extend(self, values):
+		"""add a list of values
+
+		Returns:
+		_HyperLogLog: self
+		"""
+		registers = self.registers
+		bits = 64 - self.precision
+		mask = (1 << bits) - 1
+		for h in imap(self._hash, values):
+			index = h >> bits
+			rank = bits - (h & mask).bit_length() + 1
+			if rank > registers[index]:
+				registers[index] = rank
+		return self
+
+	def merge(self, other):
+		"""add the values of another estimate with the same precision
+
+		Returns:
+		_HyperLogLog: self
+		"""
+		self.registers = bytearray(imap(max, self.registers, other.registers))
+		return self
+
+	def count(self):
+		"""estimate the number of distinct values added
+
+		Returns:
+		int: the estimate
+		"""
+		m = len(self.registers)
+		estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+		zeros = self.registers.count('\0')
+		if estimate <= 2.5 * m and zeros:
+			# linear counting is more accurate for small sets
+			estimate = m * math.log(float(m) / zeros)
+		return int(round(estimate))
+
+_hll_hash = struct.Struct('<Q')
+
+# The initial value, update and merge functions of each kind of running accumulator.
+# The update functions add a non-empty list of values to the accumulator
+_accumulators = {
+	'count': (int, lambda acc, values: acc + sum(values), operator.add),
+	'sum': (int, lambda acc, values: acc + sum(values), operator.add),
+	'min': (lambda: _MISSING, lambda acc, values: _min_step(acc, min(values)), _min_step),
+	'max': (lambda: _MISSING, lambda acc, values: _max_step(acc, max(values)), _max_step),
+	'avg': (lambda: (0, 0), lambda acc, values: (acc[0] + sum(values), acc[1] + len(values)), lambda acc, other: (acc[0] + other[0], acc[1] + other[1])),
+	'var': (lambda: (0, 0.0, 0.0), _var_update, _var_merge),
+	'digest': (_TDigest, lambda acc, values: acc.extend(values), lambda acc, other: acc.merge(other)),
+	'hll': (_HyperLogLog, lambda acc, values: acc.extend(values), lambda acc, other: acc.merge(other)),
+}
+
+# The accumulator of each aggregate and the function which gets its value from the accumulator
+_aggregate_functions = {
+	'count': ('count', None),
+	'sum': ('sum', None),
+	'min': ('min', _extreme_final),
+	'max': ('max', _extreme_final),
+	'avg': ('avg', lambda acc: acc[0] / acc[1] if acc[1] else None),
+	'var': ('var', _var_final),
+	'std': ('var', lambda acc: math.sqrt(acc[2] / acc[0]) if acc[0] else None),
+	'approx_distinct': ('hll', lambda acc: acc.count()),
+}
+
+# Number of rows whose values are gathered and added to the aggregates together
+_AGGREGATE_BLOCK = 4096
+
+# Percentile aggregates are named p followed by the percentile, e.g. p99 or p99.9
+_percentile_name = re.compile(r'^p(\d+(\.\d+)?)$')
+
+def _aggregate_function(name):
+	"""get the accumulator and final function of aggregate ``name``, or None if there is no such aggregate"""
+	if name in _aggregate_functions:
+		return _aggregate_functions[name]
+	match = _percentile_name.match(name)
+	if match and float(match.group(1)) <= 100:
+		q = float(match.group(1)) / 100
+		return ('digest', lambda acc: acc.quantile(q))
+	return None
+
+def _parse_aggregates(aggregates):
+	"""get the (aggregate, column) specs of a dict of aggregate names and a column or list of columns
+
+	Raises:
+	TypeError: if an aggregate doesn't exist
+	"""
+	specs = []
+	for name in sorted(aggregates):
+		if _aggregate_function(name) is None:
+			raise TypeError("unknown aggregate '%s'" % name)
+		cols = aggregates[name]
+		for col in cols if isinstance(cols, (list, tuple)) else [cols]:
+			specs.append((name, col))
+	return tuple(specs)
+
+def _aggregate_name(name, col):
+	"""get the name of the result column of an aggregate"""
+	return name if col is None else '%s_%s' % (name, col)
+
+def _accumulator_specs(specs):
+	"""get the accumulators needed to calculate aggregate ``specs``
+
+	Aggregates of the same column which can be calculated from the same
+	accumulator share it, e.g. var and std, or several percentiles.
+
+	Returns:
+	tuple: a list of distinct (accumulator, column) pairs and the position of the accumulator of each spec
+	"""
+	accumulators, positions = [], []
+	for name, col in specs:
+		acc = (_aggregate_function(name)[0], col)
+		if acc not in accumulators:
+			accumulators.append(acc)
+		positions.append(accumulators.index(acc))
+	return accumulators, positions
+
+def _init_accumulators(accumulators):
+	return [_accumulators[kind][0]() for kind, col in accumulators]
+
+def _accumulate(src, rows, specs, group=None):
+	"""update the running accumulators of aggregate ``specs`` for each group of ``rows`` in a single pass
+
+	The rows are read in blocks and the values of each column in a block
+	are gathered once and added to every accumulator of the column together.
+
+	Keyword arguments:
+	src (object): query access to the table data
+	rows (iterator): the rows to aggregate
+	specs (list): (aggregate, column) pairs. Counting column None counts the rows
+	group (function): get the group key of a row (default: aggregate all rows as the group None)
+
+	Returns:
+	tuple: the group keys in the order they were first seen, and the accumulators of each group
+	"""
+	accumulators, positions = _accumulator_specs(specs)
+	getters, columns, updates = [], [], []
+	for kind, col in accumulators:
+		# the values counted are whether each row contains the column
+		getter = (kind == 'count', col)
+		if getter not in getters:
+			getters.append(getter)
+		columns.append(getters.index(getter))
+		updates.append(_accumulators[kind][1])
+	getters = [src.getter(col) if not count else src.contains(col) if col is not None else None for count, col in getters]
+	positions = range(len(accumulators))
+
+	groups = {}
+	order = []
+	for block in _batches(rows, _AGGREGATE_BLOCK):
+		if group is None:
+			keys, buckets = [None], {None: block}
+		else:
+			keys, buckets = [], {}
+			for item in block:
+				k = group(item)
+				bucket = buckets.get(k)
+				if bucket is None:
+					bucket = buckets[k] = []
+					keys.append(k)
+				bucket.append(item)
+
+		for k in keys:
+			items = buckets[k]
+			acc = groups.get(k)
+			if acc is None:
+				acc = groups[k] = _init_accumulators(accumulators)
+				order.append(k)
+			values = [map(get, items) if get is not None else [1] * len(items) for get in getters]
+			for i in positions:
+				acc[i] = updates[i](acc[i], values[columns[i]])
+	return order, groups
+
+def _finish(specs, values):
+	"""get the value of each aggregate of ``specs`` from the accumulators ``values`` returned by ``_accumulate``
+
+	Returns:
+	list: the value of each aggregate
+	"""
+	accumulators, positions = _accumulator_specs(specs)
+	res = []
+	for (name, col), pos in zip(specs, positions):
+		final = _aggregate_function(name)[1]
+		res.append(final(values[pos]) if final else values[pos])
+	return res
+
+def _run_steps(steps):
+	"""execute compiled query steps, each reading the output of the step before it"""
+	rows = None
+	for name, detail, func in steps:
+		rows = func(rows)
+	return rows
+
+_executor = None
+_executor_lock = Lock()
+
+def _default_executor():
+	"""get the thread pool which runs queries and loads for acall and aload_json, created when it is first used
+
+	Raises:
+	ImportError: if the futures package isn't installed
+	"""
+	global _executor
+	if not _futures:
+		raise ImportError("asynchronous queries need the futures package. install using 'easy_install futures'")
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=cpu_count())
+	return _executor
+
+def _peak_memory():
+	"""get the peak resident memory of the process in bytes, or None if it can't be measured"""
+	if not _resource:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# macOS reports bytes rather than kilobytes
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+class _Profiler(object):
+	"""records the time, rows and memory of each step of a query as it runs
+
+	Steps pull rows from the step before them, so the time spent reading
+	from the previous step is subtracted from the time of each step.
+
+	Attributes:
+		entries (list): a dict for each step with its 'step' name, 'detail', 'time' in seconds, 'rows_in', 'rows_out' and 'peak_memory' in bytes
+	"""
+	def __init__(self, src):
+		"""Constructor.
+
+		Keyword arguments:
+		src (object): query access to the rows read by the first step
+		"""
+		try:
+			self._src_rows = len(src)
+		except (TypeError, AttributeError):
+			# a scanned file isn't counted before it is read
+			self._src_rows = None
+		self.entries = []
+		self._inclusive = []
+
+	def wrap(self, steps):
+		"""get ``steps`` with each function wrapped to record its profile"""
+		res = []
+		for i, (name, detail, func) in enumerate(steps):
+			self.entries.append({'step': name, 'detail': detail, 'time': 0.0, 'rows_in': self._src_rows if i == 0 else None, 'rows_out': 0, 'peak_memory': None})
+			self._inclusive.append(0.0)
+			res.append((name, detail, lambda rows, i=i, func=func: self._call(i, func, rows)))
+		return res
+
+	def _account(self, i, start, upstream):
+		"""add the time since ``start`` to step ``i``, less the time spent in the step before it"""
+		elapsed = time() - start
+		self._inclusive[i] += elapsed
+		self.entries[i]['time'] += elapsed - ((self._inclusive[i - 1] - upstream) if i > 0 else 0.0)
+
+	def _finish(self, i):
+		"""record the memory and row count after step ``i`` produced its last row"""
+		entry = self.entries[i]
+		entry['peak_memory'] = _peak_memory()
+		if i + 1 < len(self.entries):
+			self.entries[i + 1]['rows_in'] = entry['rows_out']
+
+	def _call(self, i, func, rows):
+		upstream = self._inclusive[i - 1] if i > 0 else 0.0
+		start = time()
+		res = func(rows)
+		self._account(i, start, upstream)
+		if isinstance(res, (list, _ColumnStore)):
+			self.entries[i]['rows_out'] = len(res)
+		elif hasattr(res, 'next'):
+			return self._iterate(i, res)
+		else:
+			self.entries[i]['rows_out'] = 1
+		self._finish(i)
+		return res
+
+	def _iterate(self, i, rows):
+		entry = self.entries[i]
+		while True:
+			upstream = self._inclusive[i - 1] if i > 0 else 0.0
+			start = time()
+			try:
+				item = rows.next()
+			except StopIteration:
+				self._account(i, start, upstream)
+				self._finish(i)
+				return
+			self._account(i, start, upstream)
+			entry['rows_out'] += 1
+			yield item
+
+class _LRUCache(object):
+	"""a size bounded mapping which discards the least recently used entries
+
+	Attributes:
+		maxsize (int): the number of entries kept
+		hits (int): the number of lookups which found an entry
+		misses (int): the number of lookups which didn't find an entry
+	"""
+	def __init__(self, maxsize):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key):
+		"""get the value of ``key``, or ``_MISSING`` if it isn't cached"""
+		value = self._entries.pop(key, _MISSING)
+		if value is _MISSING:
+			self.misses += 1
+		else:
+			self.hits += 1
+			self._entries[key] = value
+		return value
+
+	def put(self, key, value):
+		"""cache ``value`` for ``key``, discarding the least recently used entry if the cache is full"""
+		self._entries.pop(key, None)
+		self._entries[key] = value
+		if len(self._entries) > self.maxsize:
+			self._entries.popitem(last=False)
+
+	def items(self):
+		"""get a list of the cached keys and values, least recently used first"""
+		return self._entries.items()
+
+	def replace(self, key, value):
+		"""change the value of a cached ``key`` without changing when it was last used"""
+		self._entries[key] = value
+
+	def discard(self, key):
+		"""remove ``key`` from the cache"""
+		self._entries.pop(key, None)
+
+	def clear(self):
+		"""discard every entry"""
+		self._entries.clear()
+
+def _freeze(value):
+	"""get a hashable form of an operation argument, or raise TypeError if it can't be compared by value
+
+	Values are tagged with their type so different values which compare
+	equal, e.g. a list and a tuple, don't share a cached result.
+	"""
+	if isinstance(value, _Predicate):
+		return ('predicate', value.key, value.op, _freeze(value.value))
+	if isinstance(value, (_And, _Or)):
+		return (type(value).__name__, frozenset(_freeze(part) for part in value.parts))
+	if isinstance(value, _Not):
+		return ('not', _freeze(value.expr))
+	if callable(value):
+		# a function may depend on state which changes between queries
+		raise TypeError("functions can't be cached")
+	if isinstance(value, (list, tuple)):
+		return (type(value).__name__,) + tuple(_freeze(item) for item in value)
+	if isinstance(value, dict):
+		return ('dict', frozenset((key, _freeze(item)) for key, item in value.items()))
+	if isinstance(value, (set, frozenset)):
+		return ('set', frozenset(_freeze(item) for item in value))
+	hash(value)
+	return (type(value).__name__, value)
+
+# Functions which combine the cached result of an aggregate with its result over appended rows
+_cache_merges = {'count': operator.add, 'sum': operator.add, 'min': min, 'max': max}
+
+def _copy_result(value):
+	"""copy a query result so the cached result isn't changed by changes to the returned one"""
+	if isinstance(value, (list, dict)):
+		return copy.copy(value)
+	return value
+
+def _normalize_plan(plan):
+	"""get a hashable form of a query plan in which consecutive filters are in a canonical order
+
+	Returns:
+	tuple: the normalized plan
+
+	Raises:
+	TypeError: if the plan contains a value which can't be compared by value
+	"""
+	res, filters = [], []
+	for op in plan + [None]:
+		if op is not None and op[0] == 'where':
+			filters.append(_freeze(op[1]))
+			continue
+		if filters:
+			# consecutive filters are applied together so their order doesn't matter
+			res.append(('where', frozenset(filters)))
+			filters = []
+		if op is not None:
+			res.append((op[0],) + tuple(_freeze(arg) for arg in op[1:]))
+	return tuple(res)
+
 class Table(object):
 	"""A very basic tabular data manipulation class
 	
 	Attributes:
 		data (list): Contains a 'list' of dictionaries each of which represents a 'row'
+		sort_budget (int): The number of rows orderby sorts in memory, at least 1, larger results are sorted in runs spilled to temporary files
+		profile (bool): Record the time, rows and memory of each step of every query in ``last_profile``
+		last_profile (list): The profile of each step of the last profiled query, see ``explain(analyze=True)``
+		_cache (_LRUCache): Query results by their normalized plan, if enabled with enable_cache
 		_data_format (dict): a dictionary containing the name and format of each field in a 'row' dictionary
 		_result (list): Contains the rsulting list of dictionaries after querying ``data``
+		_plan (list): The operations recorded by the current query, executed when the query finishes
+		_scan_file (str): A JSON file which queries read directly instead of ``data``
+		_index_defs (set): (column, kind) pairs for each index created on the table
+		_indexes (dict): The built index for each (column, kind) pair, rebuilt when the data is replaced
+		_ordered (dict): Whether the rows are in ascending order of each tuple of join columns, discarded when the data changes
+		_view (tuple): The table and operations a joined table reads its rows from until they are executed, or None
+		_views (WeakSet): The joined tables reading this table, whose joins are executed before its rows change
+		_with_queries (list): The queries of the with blocks using the table, finished when each block ends
 		_select_columns 
 		_start_time (time): Operation start time
 		_show_result (time): Show the value of _result at the end of querying
@@ -55,92 +2842,813 @@ class Table(object):
 		_el_time (time): Operation elapsed time
 	
 	"""
-	def __init__(self, input_file=None):
+	# The queried table of a ``_Query``, None for a table
+	_table = None
+
+	def __init__(self, input_file=None, columnar=False, workers=None):
 		"""Constructor. Will load file specified by input_parameter if supplied
 
-		input_file (str): file containing tabular data (json or csv) (default: None)
+		input_file (str): file containing tabular data (json or csv) (default: None)
+		columnar (bool): store the data as typed columns rather than a list of dictionaries (default: False)
+		workers (int): number of processes used to parse JSON files and aggregate scanned files (default: None)
+		"""
+		self.show_json = False
+		self.columnar = columnar
+		self.workers = workers
+		self._view = None
+		self._views = weakref.WeakSet()
+		self.data = []
+		self.data_format = {}
+		self._scan_file = None
+		self._index_defs = set()
+		self._indexes = {}
+		self._ordered = {}
+		self.sort_budget = _SORT_BUDGET
+		self.profile = False
+		self.last_profile = None
+		self._cache = None
+		self._with_queries = []
+		
+		if input_file is not None:
+			if input_file.endswith('json'):
+				self.load_json(input_file)
+			elif input_file.endswith('csv'):
+				self.load_csv(input_file)
+			else:
+				print 'Unknown data format: ' + input_file
+
+		self._reset()
+		self._start_time = None
+			
+	@property
+	def data(self):
+		"""get the table rows, executing the join of a joined table when they are first read"""
+		if self._view is not None:
+			self._materialize()
+		return self._data
+	@data.setter
+	def data(self, value):
+		self._data = value
+
+	def _materialize(self):
+		"""replace the join of a joined table with the joined rows"""
+		if self._view is not None:
+			rows = _run_steps(self._compile(self._source(), plan=self._view_plan()))
+			if self._view[1][-1][-1] in ('semi', 'anti') and not self.columnar:
+				# semi and anti joins keep the row dictionaries of the joined table, which can be changed in place
+				rows = [dict(row) for row in rows]
+			# the rows are the same, so the tables joined from this one can go on reading it
+			views, self._views = self._views, weakref.WeakSet()
+			self._setdata(rows, self.data_format or None)
+			self._views = views
+
+	def _freeze_views(self):
+		"""execute the joins of the joined tables reading this table before its rows change
+
+		A joined table reads the rows of the tables it joins until they
+		change, and then keeps the rows they had when it was joined.
+		"""
+		views, self._views = list(self._views), weakref.WeakSet()
+		for view in views:
+			view._materialize()
+
+	def _view_root(self):
+		"""get the table whose rows are read by the joins of a joined table, or self"""
+		return self if self._view is None else self._view[0]._view_root()
+
+	def _view_plan(self):
+		"""get the operations which produce the rows of a joined table from the rows of ``_view_root``"""
+		if self._view is None:
+			return []
+		table, plan = self._view
+		return table._view_plan() + plan
+
+	def _running(self):
+		"""get the query continued by an operation, this query if it is running or else a new query of the table"""
+		if self._table is None:
+			return _Query(self)
+		if self._start_time is None:
+			self._reset()
+		return self
+
+	def _reset(self):
+		"""resets the query state variables"""
+		self._select_columns = []
+		self._start_time = time()
+		self._show_result = True
+		self._is_fluent = True
+
+		# the rows of a joined table aren't read until its join is executed
+		self._result = self._data
+		self._plan = []
+		self._rows_selected = 0
+		self._el_time = 0
+
+	def _execute(self, columns=None, lazy=False, profile=False):
+		"""execute the query plan against the table data
+
+		Keyword arguments:
+		columns (list): only build these columns into the result rows (default: all columns)
+		lazy (bool): return an iterator which builds the result rows as they are read (default: False)
+		profile (bool): record the profile of each step in ``last_profile`` (default: False)
+
+		Returns:
+		list or object: the rows produced by the query, or the value of an aggregate
+		"""
+		src = self._source()
+		steps = self._compile(src, columns, lazy)
+		if profile:
+			profiler = _Profiler(src)
+			steps = profiler.wrap(steps)
+			self.last_profile = profiler.entries
+		return _run_steps(steps)
+
+	def _compile(self, src, columns=None, lazy=False, plan=None):
+		"""build the steps which execute the query plan against ``src``
+
+		Consecutive ``where`` operations are fused into a single filter and
+		each step pulls rows from the one before it, so a ``limit`` stops
+		the scan as soon as it has enough rows.  Steps which need every row
+		(e.g. ``orderby``) consume their input before yielding.  Filters at
+		the start of the plan can be answered by an index or handed to the
+		data source, which may evaluate them without visiting each row.
+
+		Keyword arguments:
+		src (object): query access to the table data
+		columns (list): only build these columns into the result rows (default: all columns)
+		lazy (bool): build the result rows as they are read rather than into a list (default: False)
+		plan (list): the operations to execute (default: the joins of a joined table and the running query)
+
+		Returns:
+		list: (name, detail, function) tuples. Each function accepts the output of the previous step
+		"""
+		if self.workers > 1 and self._scan_file is not None:
+			step = self._parallel_step()
+			if step is not None:
+				return [step]
+
+		plan = self._optimize(self._view_plan() + self._plan if plan is None else plan)
+		needs = _projections(plan, columns)
+		# only the columns read by the query are kept in the rows read from a file
+		src = src.project(needs[0])
+
+		steps = []
+		scanned = False
+		is_rows = True
+		predicates = []
+		for i, op in enumerate(plan + [None]):
+			if op is not None and op[0] == 'where':
+				predicates.append(op[1])
+				continue
+
+			if not scanned:
+				# filters at the start of the plan scan the whole table
+				step, predicates = self._scan_step(src, predicates)
+				steps.append(step)
+				scanned = True
+
+			if predicates:
+				steps.append(('filter', ', '.join(_describe(func) for func in predicates), _compile_filter(src, predicates)))
+				predicates = []
+
+			if op is None:
+				break
+
+			name, args = op[0], op[1:]
+			if name in self._aggregates:
+				if not is_rows:
+					continue
+				is_rows = False
+			run = getattr(self, '_run_' + name)
+			if name == 'join':
+				other, column, alias, right, other_column, how = args
+				strategy = self._join_strategy(src, plan[:i], *args)
+				keys = ', '.join(key if key == other_key else '%s = %s' % (key, other_key) for key, other_key in zip(column, other_column))
+				detail = '%s %s join %s %s as %s on %s' % (strategy, how, 'right of' if right else 'to', other._source().describe(), alias, keys)
+				if needs[i + 1] is not None:
+					detail += ', keeping %s' % ', '.join(sorted(needs[i + 1]))
+				steps.append((name, detail, lambda rows, run=run, args=args + (strategy, needs[i + 1]), src=src: run(src, rows, *args)))
+				src = _RowList([])
+				continue
+			steps.append((name, ', '.join(_describe(arg) for arg in args), lambda rows, run=run, args=args, src=src: run(src, rows, *args)))
+			if name == 'agg':
+				# the following steps read the aggregated rows rather than the table
+				src = _RowList([])
+
+		if is_rows:
+			build = src.iter_rows if lazy else src.materialize
+			steps.append(('result', ', '.join(columns or []), lambda rows: build(rows, columns)))
+		return steps
+
+	def _optimize(self, plan):
+		"""rewrite the operations of ``plan`` which can be executed more efficiently
+
+		``orderby`` followed by ``limit`` becomes ``topn``, which keeps the
+		first rows in a bounded heap rather than sorting every row.
+
+		Returns:
+		list: the rewritten plan
+		"""
+		res = []
+		for op in plan:
+			if op[0] == 'limit' and res and res[-1][0] == 'orderby' and op[1] is not None and op[1] >= 0:
+				res[-1] = ('topn',) + res[-1][1:2] + (op[1],) + res[-1][2:]
+			else:
+				res.append(op)
+		return res
+
+	def _parallel_step(self):
+		"""build a step which filters and aggregates chunks of the scanned file in worker processes
+
+		Returns:
+		tuple: the step, or None if the plan isn't only comparisons followed by an aggregate
+		"""
+		plan = self._plan
+		if not plan or plan[-1][0] not in self._aggregates:
+			return None
+		if any(op[0] != 'where' or not isinstance(op[1], _Expression) for op in plan[:-1]):
+			return None
+
+		predicates = [op[1] for op in plan[:-1]]
+		name = plan[-1][0]
+		specs = plan[-1][1] if name == 'aggregate' else ((name, plan[-1][1]),)
+		chunks = [(self._scan_file, start, end, predicates, specs) for start, end in _split_file(self._scan_file, self.workers * 4)]
+		detail = '%s over %d chunks in %d workers' % (', '.join([_describe(pred) for pred in predicates] + ['%s %s' % spec for spec in specs]), len(chunks), self.workers)
+
+		def run(rows):
+			pool = Pool(self.workers)
+			try:
+				values = _combine_aggregates(specs, pool.map(_aggregate_chunk, chunks))
+			finally:
+				pool.close()
+				pool.join()
+			if name == 'aggregate':
+				return dict(zip([_aggregate_name(*spec) for spec in specs], values))
+			return values[0]
+		return ('parallel aggregate', detail, run)
+
+	def _scan_step(self, src, predicates):
+		"""build the step which reads rows from ``src``, applying as many of ``predicates`` as possible
+
+		Returns:
+		tuple: the step and the predicates which still need to be applied
+		"""
+		for pred in predicates:
+			if isinstance(pred, _Predicate):
+				# the filters at the start of a joined table's plan read the rows of the table it joins
+				index = self._view_root()._index_for(src, pred)
+				if index is not None:
+					# the predicate is still applied to the rows found by an inexact index
+					remaining = [func for func in predicates if func is not pred or not index.exact]
+					detail = '%s index on %s: %s' % (index.kind, pred.key, _describe(pred))
+					return ('index scan', detail, lambda rows: src.refs_at(index.lookup(pred))), remaining
+
+		refs, remaining = src.scan(predicates)
+		if len(remaining) < len(predicates):
+			detail = ', '.join(_describe(func) for func in predicates if func not in remaining)
+			return ('masked scan', detail, lambda rows: refs), remaining
+		return ('scan', src.describe(), lambda rows: refs), remaining
+
+	def create_index(self, col, kind='hash'):
+		"""create an index on column ``col`` which is used to answer filters at the start of a query
+
+		A 'hash' index answers ``eq`` and ``isin``, a 'sorted' index answers
+		``gt``, ``lt`` and the ``ge`` and ``le`` comparisons of ``col``
+		expressions, and an 'ngram' index finds the rows which may match
+		``like`` patterns containing at least 3 characters of literal text.
+		Indexes are rebuilt when the table data is replaced.
+
+		Keyword arguments:
+		col (str): name of the column to index
+		kind (str): 'hash', 'sorted' or 'ngram' (default: 'hash')
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._materialize()
+		if kind not in _index_types:
+			print "Index error: Unknown index kind '%s'." % kind
+		elif not self._source().indexable:
+			print "Index error: Tables scanning a file can't be indexed."
+		else:
+			self._index_defs.add((col, kind))
+			self._build_index(col, kind)
+		return self
+
+	def drop_index(self, col, kind='hash'):
+		"""remove the index of type ``kind`` from column ``col``
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._index_defs.discard((col, kind))
+		self._indexes.pop((col, kind), None)
+		return self
+
+	def _build_index(self, col, kind):
+		"""build the index of type ``kind`` on column ``col`` from the table data"""
+		index = self._indexes[(col, kind)] = _index_types[kind](self._source().column_values(col))
+		return index
+
+	def _index_for(self, src, pred):
+		"""get an index which can answer ``pred``, or None"""
+		if not src.indexable:
+			return None
+		for kind, index_type in _index_types.items():
+			if (pred.key, kind) in self._index_defs and pred.op in index_type.ops:
+				index = self._indexes.get((pred.key, kind)) or self._build_index(pred.key, kind)
+				if index.usable(pred):
+					return index
+		return None
+
+	def _source(self):
+		"""get query access to the table data, or for a joined table the data of the table it joins"""
+		if self._view is not None:
+			return self._view_root()._source()
+		if self._scan_file is not None:
+			return _JsonScan(self._scan_file)
+		if isinstance(self.data, _ColumnStore):
+			return self.data
+		return _RowList(self.data)
+
+	def load_json(self, file_name, workers=None):
+		"""loads JSON formatted data into the table
+
+		Keyword arguments:
+		file_name (str): a filename for a JSON file
+		workers (int): number of processes used to parse the file (default: the table's workers)
+		"""
+		workers = workers or self.workers
+		if os.path.isfile(file_name) and workers > 1:
+			start = time()
+			try:
+				data = self._load_parallel(file_name, workers)
+			except ValueError, e:
+				print "Load failed: " + str(e)
+				return
+			self._setdata(data)
+			print "Success: %d items loaded in %4.3fs" % (len(self.data), time() - start)
+		elif os.path.isfile(file_name):
+			start = time()
+			data = _ColumnStore() if self.columnar else []
+			with open(file_name, 'r') as f:
+				for line in f:
+					if not line.strip():
+						continue
+					try:
+						data.append(json.loads(line))
+					except Exception, e:
+						print "Load failed: " + e.message
+						print "Data: " + line
+						return
+			self._setdata(data)
+			print "Success: %d items loaded in %4.3fs" % (len(self.data), time() - start)
+		else:
+			print "Load Error.  File doesn't exist."
+
+	def append(self, rows):
+		"""add a row, or a list of rows, to the table
+
+		Indexes are updated with the new rows, columns found in the new rows
+		are added to the data format, and cached results of aggregates are
+		updated from the new rows rather than recalculated.
+
+		Keyword arguments:
+		rows (dict or list): a row dictionary or a list of row dictionaries
+
+		Returns:
+		object: self for fluent interface
+		"""
+		if self._scan_file is not None:
+			print "Append error: Tables scanning a file can't be changed."
+			return self
+		rows = [rows] if isinstance(rows, dict) else list(rows)
+		if not rows:
+			return self
+		if len(self.data) == 0:
+			self._setdata(rows)
+			return self
+		self._freeze_views()
+
+		start = len(self.data)
+		if isinstance(self.data, _ColumnStore):
+			for row in rows:
+				self.data.append(row)
+		else:
+			self.data.extend(rows)
+		self._add_format(rows)
+		self._ordered = {}
+		for (col, kind), index in self._indexes.items():
+			for pos, row in enumerate(rows, start):
+				value = row.get(col, _MISSING)
+				if value is not _MISSING:
+					index.add(pos, value)
+		self._refresh_cache(rows)
+		return self
+
+	def extend_from_file(self, file_name, offset=0):
+		"""append the rows of a JSON file starting at byte ``offset``, for following a file as it is written
+
+		Only complete lines are read, so a line which is still being
+		written is read by the next call.  If the file is shorter than
+		``offset`` it is assumed to have been replaced and is read from the
+		start.  Lines which aren't valid JSON are reported and skipped.
+
+		Keyword arguments:
+		file_name (str): a filename for a JSON file
+		offset (int): the byte offset to start reading from, the value returned by the previous call (default: 0)
+
+		Returns:
+		int: the byte offset after the last line read
+		"""
+		if not os.path.isfile(file_name):
+			print "Load Error.  File doesn't exist."
+			return offset
+		if os.path.getsize(file_name) < offset:
+			offset = 0
+
+		rows = []
+		with open(file_name, 'rb') as f:
+			f.seek(offset)
+			while True:
+				line = f.readline()
+				if not line.endswith('\n'):
+					break
+				if line.strip():
+					try:
+						rows.append(json.loads(line))
+					except ValueError, e:
+						# skipped so following calls aren't stuck on the same line
+						print "Skipped line: " + str(e)
+						print "Data: " + line
+				offset += len(line)
+		self.append(rows)
+		return offset
+
+	def update(self, where, values):
+		"""change the values of columns in the rows matching ``where``
+
+		Keyword arguments:
+		where (function): a ``where`` function or ``col`` expression selecting the rows to change, or None for every row
+		values (dict): the new value of each column, or a function which accepts the row dict and returns the new value
+
+		Returns:
+		object: self for fluent interface
+		"""
+		if self._scan_file is not None:
+			print "Update error: Tables scanning a file can't be changed."
+			return self
+		self._freeze_views()
+		data = self.data
+		columnar = isinstance(data, _ColumnStore)
+		indexes = [(col, index) for (col, kind), index in self._indexes.items() if col in values]
+		changed = []
+		for pos in self._positions(where):
+			row = data.row(pos) if columnar else data[pos]
+			new = dict((key, value(row) if callable(value) else value) for key, value in values.items())
+			for col, index in indexes:
+				old = row.get(col, _MISSING)
+				if old is not _MISSING:
+					index.remove(pos, old)
+				index.add(pos, new[col])
+			if columnar:
+				for key, value in new.items():
+					data.set(pos, key, value)
+			else:
+				row.update(new)
+			changed.append(new)
+		self._add_format(changed)
+		self._invalidate()
+		return self
+
+	def delete(self, where):
+		"""remove the rows matching ``where``
+
+		Keyword arguments:
+		where (function): a ``where`` function or ``col`` expression selecting the rows to remove, or None for every row
+
+		Returns:
+		object: self for fluent interface
+		"""
+		if self._scan_file is not None:
+			print "Delete error: Tables scanning a file can't be changed."
+			return self
+		deleted = self._positions(where)
+		if not deleted:
+			return self
+		self._freeze_views()
+
+		n = len(self.data)
+		mapping = array('l', [0]) * n
+		for pos in deleted:
+			mapping[pos] = -1
+		kept = []
+		for pos in xrange(n):
+			if mapping[pos] == 0:
+				mapping[pos] = len(kept)
+				kept.append(pos)
+
+		if isinstance(self.data, _ColumnStore):
+			self.data = self._result = self.data.take(kept)
+		else:
+			data = self.data
+			data[:] = [data[pos] for pos in kept]
+		for index in self._indexes.values():
+			index.remap(mapping)
+		self._invalidate()
+		return self
+
+	def _positions(self, where):
+		"""get the ascending positions of the rows matching ``where``, every row if it is None"""
+		data = self.data
+		if where is None:
+			return range(len(data))
+		predicates = where.parts if isinstance(where, _And) else [where]
+		if isinstance(data, _ColumnStore):
+			return list(_compile_filter(data, predicates)(data.refs()))
+		src = _RowList(data)
+		matched = set(id(item) for item in _compile_filter(src, predicates)(src.refs()))
+		return [pos for pos, item in enumerate(data) if id(item) in matched]
+
+	def _add_format(self, rows):
+		"""add the columns of ``rows`` which aren't in the data format"""
+		for row in rows:
+			for key, value in row.items():
+				if key not in self.data_format:
+					self.data_format[key] = type(value).__name__
+
+	def load_binary(self, file_name, compression=None):
+		"""loads rows exported in the binary row format into the table
+
+		Keyword arguments:
+		file_name (str): a filename for a binary row file
+		compression (str): the compression of the file, 'gzip' or 'bz2' (default: from the file extension)
 		"""
-		self.show_json = False
-		self.data = []
-		
-		if input_file is not None:
-			if input_file.endswith('json'):
-				self.load_json(input_file)
-			elif input_file.endswith('csv'):
-				self.load_csv(input_file)
-			else:
-				print 'Unknown data format: ' + input_file
+		if os.path.isfile(file_name):
+			start = time()
+			format, compression = _export_format(file_name, 'binary', compression)
+			data = _ColumnStore() if self.columnar else []
+			try:
+				with _compressions[compression](file_name, 'rb') as f:
+					for item in _read_binary(f):
+						data.append(item)
+			except (ValueError, EOFError, IOError), e:
+				print "Load failed: " + str(e)
+				return
+			self._setdata(data)
+			print "Success: %d items loaded in %4.3fs" % (len(self.data), time() - start)
+		else:
+			print "Load Error.  File doesn't exist."
 
-		self._reset()
-		self._start_time = None
-			
-	def _reset(self):
-		"""resets the query state variables"""
-		self._select_columns = []
-		self._start_time = time()
-		self._show_result = True
-		self._is_fluent = True
+	def save_snapshot(self, file_name):
+		"""write the table data to a binary snapshot file which can be reloaded with ``load_snapshot``
 
-		self._result = self.data
-		self._rows_selected = 0
-		self._el_time = 0
+		The data is written a column at a time in the same format used by
+		columnar tables.
 
-	def load_json(self, file_name):
-		"""loads JSON formatted data into the table
+		Keyword arguments:
+		file_name (str): target filename for the snapshot
+
+		Returns:
+		object: self for fluent interface
+		"""
+		if not os.path.isfile(file_name):
+			data = self.data
+			if not isinstance(data, _ColumnStore):
+				src = self._source()
+				data = _ColumnStore(src.iter_rows(src.refs()), self.data_format)
+			_write_snapshot(data, file_name, self.data_format)
+			print "Saved %d rows to: %s." % (len(data), file_name)
+		else:
+			print "Snapshot error: File already exists."
+		return self
+
+	def load_snapshot(self, file_name):
+		"""loads a snapshot written by ``save_snapshot`` into the table
+
+		The file is memory mapped and only its header is read.  Each column
+		is read the first time a query uses it, so columns a query never
+		touches are never read from disk.  NumPy filters read directly from
+		the mapped file, so its pages are shared between processes.
 
 		Keyword arguments:
-		file_name (str): a filename for a JSON file
+		file_name (str): a filename for a snapshot file
 		"""
 		if os.path.isfile(file_name):
 			start = time()
-			data = []
-			with open(file_name, 'r') as f:
-				for line in f.readlines():
-					try:
-						data.append(json.loads(line))
-					except Exception, e:
-						print "Load failed: " + e.message
-						print "Data: " + line
-						return
-			self._setdata(data)
+			try:
+				data, data_format = _read_snapshot(file_name)
+			except (ValueError, mmap.error), e:
+				print "Load failed: " + str(e)
+				return
+			self.columnar = True
+			self._setdata(data, data_format)
 			print "Success: %d items loaded in %4.3fs" % (len(self.data), time() - start)
 		else:
 			print "Load Error.  File doesn't exist."
 
-	def load_csv(self, file_name):
+	def _load_parallel(self, file_name, workers):
+		"""parse a JSON file in ``workers`` processes
+
+		The file is split into chunks at line boundaries and the rows parsed
+		from each chunk are added to the table in their original order.
+
+		Returns:
+		list or _ColumnStore: the rows in the file
+		"""
+		data = _ColumnStore() if self.columnar else []
+		chunks = [(file_name, start, end, self.columnar) for start, end in _split_file(file_name, workers * 4)]
+		pool = Pool(workers)
+		try:
+			for chunk in pool.imap(_load_chunk, chunks):
+				data.extend(chunk)
+		finally:
+			pool.close()
+			pool.join()
+		return data
+
+	@classmethod
+	def aload_json(cls, file_name, columnar=False, workers=None, executor=None):
+		"""load a JSON file into a new table in a thread pool, see ``load_json``
+
+		Keyword arguments:
+		file_name (str): a filename for a JSON file
+		columnar (bool): store the data as typed columns (default: False)
+		workers (int): number of processes used to parse the file (default: None)
+		executor (Executor): the executor which loads the file (default: a shared thread pool)
+
+		Returns:
+		Future: the loaded Table
+		"""
+		tbl = cls(columnar=columnar, workers=workers)
+		def load():
+			tbl.load_json(file_name)
+			return tbl
+		return (executor or _default_executor()).submit(load)
+
+	@classmethod
+	def scan_json(cls, file_name, workers=None):
+		"""create a table which runs queries directly against a JSON file without loading it
+
+		The file is read a line at a time each time a query is executed, so
+		aggregates, filters and exports use constant memory regardless of the
+		size of the file.
+
+		If ``workers`` is set, queries which only filter with the comparison
+		operations before an aggregate are run on chunks of the file in
+		``workers`` processes, and the partial aggregates are combined.
+
+		Keyword arguments:
+		file_name (str): a filename for a JSON file
+		workers (int): number of processes used to aggregate the file (default: None)
+
+		Returns:
+		Table: a table reading from ``file_name``
+		"""
+		tbl = cls(workers=workers)
+		if os.path.isfile(file_name):
+			tbl._scan_file = file_name
+			for item in _JsonScan(file_name).refs():
+				tbl.data_format = {key:type(value).__name__ for key, value in item.items() }
+				break
+		else:
+			print "Load Error.  File doesn't exist."
+		return tbl
+
+	def load_csv(self, file_name, chunk_size=None):
 		"""loads CSV formatted data into the table
 
+		The first line of the file contains the column names.  The type of
+		each column (bool, int, float or unicode) is inferred from a sample of
+		the rows, and the file is read and converted ``chunk_size`` rows at a
+		time, a column at a time.  Empty values in bool, int and float columns
+		are loaded as None.
+
 		Keyword arguments:
 		file_name (str): a filename for a CSV file
+		chunk_size (int): number of rows read and converted at a time (default: 10000)
 		"""
 		if os.path.isfile(file_name):
 			start = time()
-			data = []
-			with csv.DictReader(open(file_name, 'r')) as d:
-				for row in f.readlines():
-					try:
-						data.append(row)
-					except Exception, e:
-						print "Load failed: " + e.message
-						print "Data: " + line
-						return
+			data = _ColumnStore() if self.columnar else []
+			try:
+				for names, columns in _read_csv(file_name, chunk_size or _CSV_CHUNK):
+					if self.columnar:
+						data.extend(_ColumnStore.from_columns(names, columns))
+					else:
+						data.extend(dict(zip(names, values)) for values in zip(*columns))
+			except (csv.Error, ValueError), e:
+				print "Load failed: " + str(e)
+				return
 			self._setdata(data)
 			print "Success: %d items loaded in %4.3fs" % (len(self.data), time() - start)
 		else:
 			print "Load Error.  File doesn't exist."
 
-	def _setdata(self, new_data):
+	def _setdata(self, new_data, data_format=None):
 		"""replaces the contents of the table with new_data
 
 		Keyword arguments:
 		new_data (list): the data which will replace the current data member
+		data_format (dict): the format of new_data (default: the format of the first row)
 		"""
-		self.data_format = {}
+		self._freeze_views()
+		self.data_format = data_format or {}
+		if data_format is None and len(new_data) > 0:
+			self.data_format = {key:type(value).__name__ for key, value in new_data[0].items() }
+
+		if self.columnar and not isinstance(new_data, _ColumnStore):
+			new_data = _ColumnStore(new_data, self.data_format)
+		self._view = None
 		self.data = new_data
 		self._result = self.data
+		self._indexes = {}
+		self._invalidate()
+
+	def _invalidate(self):
+		"""discard cached query results after the table data has changed"""
+		self._ordered = {}
+		if self._cache is not None:
+			self._cache.clear()
+
+	def _refresh_cache(self, rows):
+		"""update the cached results of queries which can be updated from appended ``rows``, and discard the others
+
+		The results of ``count``, ``sum``, ``min`` and ``max`` after filtering
+		with expressions are combined with the result of the query over
+		the new rows.
+		"""
+		if self._cache is None:
+			return
+		src = _RowList(rows)
+		for key, (result, plan) in self._cache.items():
+			value = _MISSING
+			if plan and plan[-1][0] in _cache_merges and all(op[0] == 'where' for op in plan[:-1]):
+				predicates = [op[1] for op in plan[:-1]]
+				try:
+					matched = list(_compile_filter(src, predicates)(src.refs())) if predicates else rows
+					name, col = plan[-1]
+					value = _cache_merges[name](result, getattr(self, '_run_' + name)(src, iter(matched), col)) if matched else result
+				except (KeyError, TypeError, ValueError):
+					# e.g. a new row without a filtered column, the query is executed again when it is next run
+					value = _MISSING
+			if value is _MISSING:
+				self._cache.discard(key)
+			else:
+				self._cache.replace(key, (value, plan))
+
+	def enable_cache(self, size=128):
+		"""cache the results of the last ``size`` distinct queries
+
+		A query with the same operations as a cached query, ignoring the
+		order of consecutive filters, returns the cached result rather than
+		being executed.  Queries filtering with ``where`` functions are not
+		cached.  The cache is cleared when the table data is replaced, but
+		not if the rows in ``data`` are changed directly.
+
+		Keyword arguments:
+		size (int): the number of query results to keep (default: 128)
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._cache = _LRUCache(size)
+		return self
+
+	def disable_cache(self):
+		"""stop caching query results and discard the cache
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._cache = None
+		return self
+
+	def cache_info(self):
+		"""get the hits, misses, current size and maximum size of the query result cache
 
-		if len(self.data) > 0:
-			self.data_format = {key:type(value).__name__ for key, value in self.data[0].items() }
+		Returns:
+		dict: the cache statistics, or None if the cache isn't enabled
+		"""
+		if self._cache is None:
+			return None
+		return {'hits': self._cache.hits, 'misses': self._cache.misses, 'size': len(self._cache), 'maxsize': self._cache.maxsize}
+
+	def _cache_key(self):
+		"""get the key of the running query in the result cache, or None if it can't be cached"""
+		try:
+			plan = _normalize_plan(self._view_plan() + self._plan)
+		except TypeError:
+			return None
+		source = None
+		if self._scan_file is not None:
+			# a scanned file may change between queries
+			stat = os.stat(self._scan_file)
+			source = (self._scan_file, stat.st_mtime, stat.st_size)
+		return source, plan, tuple(self._select_columns)
+
+	# Operations which reduce the rows of a query to a single value
+	_aggregates = ('count', 'sum', 'min', 'max', 'avg', 'approx_distinct', 'aggregate')
 
 	# Decorator for pre-query setup
 	def operation(f):
@@ -150,7 +3658,7 @@ class Table(object):
 		f (function): a query operatiom function
 		"""
 		def new_op(*args, **kwargs):
-			"""determines if a query is already running and resets the query state members if it isn't
+			"""applies the operation to the running query, starting a new query if it is called on the table
 
 			Keyword arguments:
 			args (list): 
@@ -160,13 +3668,12 @@ class Table(object):
 			None or the function return
 			"""
 			self = args[0]
-			if len(self.data) > 0:			
-				if self._start_time is None:
-					self._reset()
-				if self._is_fluent:
-					return f(*args, **kwargs)
+			if self._scan_file is not None or self._view is not None or len(self.data) > 0:
+				query = self._running()
+				if query._is_fluent:
+					return f(query, *args[1:], **kwargs)
 				else:
-					f(*args, **kwargs)
+					f(query, *args[1:], **kwargs)
 		return new_op
 
 	@property
@@ -183,31 +3690,84 @@ class Table(object):
 		self._show_result = value
 
 	@operation
-	def export(self, file_name):
-		"""write the table or query result in JSON format, to the file specified by the parameter
-		
+	def export(self, file_name, format=None, compression=None, parallel=False):
+		"""write the table or query result to the file specified by the parameter
+
+		The rows are read from the query as they are produced and written in
+		batches, so the result is never held in memory.
+
+		The format is one of 'json' (a JSON object per line), 'csv' or
+		'binary' (each row marshalled and prefixed with its size, which can
+		be read with ``load_binary``).  If it isn't given it is taken from the
+		file extension: '.csv' is CSV, '.bin' is binary and anything else is
+		JSON.  Compression is 'gzip' or 'bz2', and is taken from a '.gz' or
+		'.bz2' extension if it isn't given.
+
 		Keyword arguments:
 		file_name (str): target filename for exporting the table
-		
+		format (str): the format of the file (default: from the file extension)
+		compression (str): the compression of the file (default: from the file extension)
+		parallel (bool or int): serialize batches of rows in this many processes, or one per CPU if True (default: False)
+
 		Returns:
 		object: self for fluent interface
 		"""
-		if not os.path.isfile(file_name):
-			with open(file_name,'w') as out:
-				_export_data = None
-				if self._start_time is not None:
-					_export_data = self._result
-				else:
-					_export_data = self.data
+		format, compression = _export_format(file_name, format, compression)
+		if os.path.isfile(file_name):
+			print "Export error: File already exists."
+		elif format not in _serializers:
+			print "Export error: Unknown format '%s'." % format
+		elif compression not in _compressions:
+			print "Export error: Unknown compression '%s'." % compression
+		else:
+			batches = _batches(self._execute(self._select_columns, lazy=True), _EXPORT_BATCH)
+			first = next(batches, [])
+			columns = []
+			if format == 'csv' and first:
+				columns = self._select_columns or sorted(first[0].keys())
+			batches = ((format, columns, batch) for batch in chain([first] if first else [], batches))
 
-				for item in _export_data:
-					out.write('%s\n' % json.dumps(item))
+			rows = 0
+			with _compressions[compression](file_name, 'wb') as out:
+				if format == 'csv':
+					out.write(_serialize_csv([dict(zip(columns, columns))], columns))
+				for count, data in self._serialize(batches, parallel):
+					out.write(data)
+					rows += count
 
-				print "Exported %d rows to: %s." % ( len(_export_data), file_name)
-		else:
-			print "Export error: File already exists."
+			print "Exported %d rows to: %s." % (rows, file_name)
 		return self
 
+	def _serialize(self, batches, parallel):
+		"""serialize batches of rows for export, in worker processes if ``parallel`` is set
+
+		Only a few batches per process are serialized at a time, so the rows
+		are still read from the query as they are written.
+
+		Returns:
+		generator: the number of rows and the serialized data of each batch, in order
+		"""
+		if not parallel:
+			for args in batches:
+				yield len(args[2]), _serialize_batch(args)
+			return
+
+		workers = cpu_count() if parallel is True else parallel
+		pool = Pool(workers)
+		try:
+			pending = deque()
+			for args in batches:
+				pending.append((len(args[2]), pool.apply_async(_serialize_batch, (args,))))
+				if len(pending) > workers * 2:
+					count, res = pending.popleft()
+					yield count, res.get()
+			while pending:
+				count, res = pending.popleft()
+				yield count, res.get()
+		finally:
+			pool.close()
+			pool.join()
+
 	@operation
 	def desc(self):
 		"""print the names and datatypes of the columns in the table
@@ -223,6 +3783,61 @@ class Table(object):
 		print tbl
 		return self
 
+	@operation
+	def explain(self, show=True, analyze=False):
+		"""describe how the query will be executed, including whether an index will be used
+
+		The query can be continued after it has been explained.  With
+		``analyze`` the query is executed and the time, rows read and
+		written, and peak process memory of each step are recorded in
+		``last_profile``.
+
+		Keyword arguments:
+		show (bool): if true the plan will be displayed
+		analyze (bool): if true execute the query and profile each step (default: False)
+
+		Returns:
+		list: a description of each step of the query, or the profile of each step with ``analyze``
+		"""
+		if analyze:
+			self._execute(self._select_columns, profile=True)
+			if show:
+				self._show_profile()
+			return self.last_profile
+
+		steps = ['%s: %s' % (name, detail) if detail else name for name, detail, func in self._compile(self._source(), self._select_columns)]
+		if show:
+			if _prettytable:
+				tbl = PrettyTable(['Step', 'Operation'])
+				tbl.align['Operation'] = 'l'
+				for i, step in enumerate(steps):
+					tbl.add_row([i + 1, step])
+				print tbl
+			else:
+				for i, step in enumerate(steps):
+					print "%d. %s" % (i + 1, step)
+		return steps
+
+	def _show_profile(self):
+		"""display ``last_profile``"""
+		header = ['Step', 'Operation', 'Time (ms)', 'Rows in', 'Rows out', 'Peak memory (MB)']
+		rows = []
+		for i, entry in enumerate(self.last_profile):
+			operation = '%s: %s' % (entry['step'], entry['detail']) if entry['detail'] else entry['step']
+			rows.append([i + 1, operation, '%.3f' % (entry['time'] * 1000),
+				'-' if entry['rows_in'] is None else entry['rows_in'], entry['rows_out'],
+				'-' if entry['peak_memory'] is None else '%.1f' % (entry['peak_memory'] / 1048576.0)])
+		if _prettytable:
+			tbl = PrettyTable(header)
+			tbl.align['Operation'] = 'l'
+			for row in rows:
+				tbl.add_row(row)
+			print tbl
+		else:
+			print ' | '.join(header)
+			for row in rows:
+				print ' | '.join(str(value) for value in row)
+
 	@operation
 	def select(self, columns=[]):
 		"""select the columns to return
@@ -242,6 +3857,10 @@ class Table(object):
 	@operation
 	def where(self, func):
 		"""filter the _result list based on the return on the lambad function as defined by func
+
+		``func`` can also be an expression built with ``col``, e.g.
+		``(col('class_id') > 1) & col('paid').isin([True])``.  The filters of
+		a query are compiled into a single function.
 		
 		Keyword arguments:
 		func (lambda): a function which returns a boolean and accepts a dict param
@@ -249,7 +3868,9 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = [item for item in self._result if func(item)]
+		# each part of a conjunction can be answered by an index or a masked scan
+		for part in func.parts if isinstance(func, _And) else [func]:
+			self._plan.append(('where', part))
 		return self
 
 	def eq(self, key, value):
@@ -262,7 +3883,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] == value)
+		return self.where(_Predicate(key, 'eq', value))
 	
 	def ne(self, key, value):
 		"""compare the inequality of the value of the column with the name ``key`` to the parameter ``value`` for each row in the table
@@ -274,7 +3895,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] != value)
+		return self.where(_Predicate(key, 'ne', value))
 
 	def gt(self, key, value):
 		"""compare where the value of column ``key`` is greater than parameter ``value`` for each row in the table
@@ -286,7 +3907,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] > value)
+		return self.where(_Predicate(key, 'gt', value))
 
 	def lt(self, key, value):
 		"""compare where the value of column ``key`` is less than parameter ``value`` for each row in the table
@@ -298,7 +3919,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] < value)
+		return self.where(_Predicate(key, 'lt', value))
 
 	def isin(self, key, lst):
 		"""compare where the value of column ``key`` is found in parameter list ``value`` for each row in the table
@@ -310,7 +3931,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] in lst)
+		return self.where(_Predicate(key, 'isin', lst))
 
 	def notin(self, key, lst):
 		"""compare where the value of column ``key`` is not found in parameter list ``value`` for each row in the table
@@ -322,7 +3943,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		return self.where(lambda item: item[key] not in lst)
+		return self.where(_Predicate(key, 'notin', lst))
 
 	def like(self, key, search_expr):
 		"""compare where the value of column ``key`` matches the regular expression ``search_expr``
@@ -334,8 +3955,7 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		exp = re.compile(search_expr)
-		return self.where(lambda item: exp.search(str(item[key])) != None )
+		return self.where(_Predicate(key, 'like', search_expr))
 
 	def notlike(self, key, search_expr):
 		"""compare where the value of column ``key`` does not match the regular expression ``search_expr``
@@ -347,38 +3967,121 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		exp = re.compile(search_expr)
-		return self.where(lambda item: exp.search(str(item[key])) == None )
+		return self.where(_Predicate(key, 'notlike', search_expr))
 
 	@operation
 	def orderby(self, key=True, reverse=False):
 		"""order the rows in the table by the value of column ``key``
+
+		Rows with equal keys keep their order.  Followed by ``limit``, only
+		the first rows are kept as the rows are read (see ``topn``).
 		
 		Keyword arguments:
-		key (str): name of the column on which to execute the order 
-		reverse (bool): reverse order (default: False)
+		key (str or list): name of the column, or a list of the columns, on which to execute the order
+		reverse (bool or list): reverse order, or a list of whether to reverse the order of each column (default: False)
 		
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = sorted(self._result, key=itemgetter(key), reverse=reverse)
+		self._plan.append(('orderby', key, reverse))
+		return self
+
+	def _run_orderby(self, src, rows, key, reverse):
+		"""sort ``rows`` by the value of column ``key``"""
+		keyfunc, reverse = _sort_key(src, key, reverse)
+		return _external_sort(rows, keyfunc, reverse, self.sort_budget)
+
+	@operation
+	def topn(self, key, n, reverse=False):
+		"""limit the rows in the result set to the first ``n`` rows ordered by column ``key``
+
+		The result is the same as ``orderby(key, reverse).limit(n)``, but
+		only ``n`` rows are kept in a heap as the rows are read rather than
+		sorting all of them.
+
+		Keyword arguments:
+		key (str or list): name of the column, or a list of the columns, on which to execute the order
+		n (int): number of rows to restrict the result set to
+		reverse (bool or list): reverse order, or a list of whether to reverse the order of each column (default: False)
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._plan.append(('topn', key, n, reverse))
 		return self
 
+	def _run_topn(self, src, rows, key, n, reverse):
+		"""get the first ``n`` of ``rows`` ordered by the value of column ``key``"""
+		if n < 0:
+			# like limit, a negative n drops the last rows, which needs every row sorted
+			return iter(list(self._run_orderby(src, rows, key, reverse))[:n])
+		keyfunc, reverse = _sort_key(src, key, reverse)
+		# nsmallest and nlargest keep equal rows in their order, like sorted
+		return iter((heapq.nlargest if reverse else heapq.nsmallest)(n, rows, key=keyfunc))
+
 	@operation
 	def groupby(self, key):
 		"""group the rows in table by column ``key``
+
+		Followed by ``agg``, the rows of each group are aggregated into a
+		single row.
 		
 		Keyword arguments:
-		key (str): name of the column on which to execute the group by
+		key (str or list): name of the column, or a list of the columns, on which to execute the group by
 		
 		Returns:
 		object: self for fluent interface
 		"""
+		self._plan.append(('groupby', key))
+		return self
+
+	def _run_groupby(self, src, rows, key):
+		"""bucket ``rows`` by the value of column ``key``"""
+		get = _key_getter(src, _key_columns(key))
 		res = defaultdict(list)
-		for item in self._result: res[item[key]].append(item)
-		self._result = [item for group in res.values() for item in group]
+		for item in rows: res[get(item)].append(item)
+		return (item for group in res.values() for item in group)
+
+	@operation
+	def agg(self, **aggregates):
+		"""aggregate the rows of each group of the preceding ``groupby`` into a single row
+
+		Each keyword is the name of an aggregate and its value is the
+		column, or a list of the columns, to aggregate.  The aggregates are
+		count, sum, min, max, avg, var (the population variance), std (the
+		population standard deviation), approx_distinct (an estimate of the
+		number of distinct values) and approximate percentiles named p
+		followed by the percentile, e.g. p99.  ``count=None`` counts the
+		rows in each group.  Each result row contains the group key columns
+		and a column for each aggregate named after the aggregate and its
+		column, e.g. 'sum_amount', or 'count' when counting rows.  Without
+		a ``groupby`` the whole result is aggregated into one row.
+
+		The groups are aggregated in a single pass over the rows, keeping a
+		running total for each aggregate of each group rather than the rows.
+
+		Returns:
+		object: self for fluent interface
+		"""
+		specs = _parse_aggregates(aggregates)
+		key = None
+		if self._plan and self._plan[-1][0] == 'groupby':
+			key = self._plan.pop()[1]
+		self._plan.append(('agg', key, specs))
 		return self
 
+	def _run_agg(self, src, rows, key, specs):
+		"""aggregate ``rows`` into a row for each value of the group ``key``"""
+		columns = _key_columns(key)
+		order, groups = _accumulate(src, rows, specs, _key_getter(src, columns) if columns else None)
+		names = [_aggregate_name(*spec) for spec in specs]
+		res = []
+		for k in order:
+			row = dict(zip(columns, k if len(columns) > 1 else (k,)))
+			row.update(zip(names, _finish(specs, groups[k])))
+			res.append(row)
+		return iter(res)
+
 	@operation
 	def limit(self, lim):
 		"""limit the rows in the result set to ``lim`` rows
@@ -389,9 +4092,15 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = self._result[:lim]
+		self._plan.append(('limit', lim))
 		return self
 
+	def _run_limit(self, src, rows, lim):
+		"""stop reading ``rows`` once ``lim`` rows have been read"""
+		if lim is not None and lim < 0:
+			return iter(list(rows)[:lim])
+		return islice(rows, lim)
+
 	@operation
 	def count(self, col=None):
 		"""count the number of rows in the result. if ``col`` parameter exists count col ``col``
@@ -406,14 +4115,16 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		if isinstance(self._result, list):
-			if col is None:
-				self._result = len(self._result)
-			else:
-				c = len([1 for item in self._result if hasattr(item,col)])
-				self._result = c
+		self._plan.append(('count', col))
 		return self
 
+	def _run_count(self, src, rows, col):
+		"""count ``rows``, or the rows in ``rows`` containing column ``col``"""
+		if col is None:
+			return sum(1 for item in rows)
+		contains = src.contains(col)
+		return sum(1 for item in rows if contains(item))
+
 	@operation
 	def sum(self, col):
 		"""sum the values in the column ``col``
@@ -424,9 +4135,13 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = sum([item[col] for item in self._result])
+		self._plan.append(('sum', col))
 		return self
 
+	def _run_sum(self, src, rows, col):
+		"""sum column ``col`` of ``rows``"""
+		return sum(imap(src.getter(col), rows))
+
 	@operation
 	def min(self, col):
 		"""get the minimum value in the column ``col``
@@ -437,9 +4152,13 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = min([item[col] for item in self._result])
+		self._plan.append(('min', col))
 		return self
 
+	def _run_min(self, src, rows, col):
+		"""get the minimum of column ``col`` of ``rows``"""
+		return min(imap(src.getter(col), rows))
+
 	@operation
 	def max(self, col):
 		"""get the maximum value in the column ``col``
@@ -450,9 +4169,13 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = max([item[col] for item in self._result])
+		self._plan.append(('max', col))
 		return self
 
+	def _run_max(self, src, rows, col):
+		"""get the maximum of column ``col`` of ``rows``"""
+		return max(imap(src.getter(col), rows))
+
 	@operation
 	def avg(self, col):
 		"""get the average value in the column ``col``
@@ -463,71 +4186,238 @@ class Table(object):
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = sum([item[col] for item in self._result]) / len(self._result)
+		self._plan.append(('avg', col))
+		return self
+
+	def _run_avg(self, src, rows, col):
+		"""get the average of column ``col`` of ``rows``"""
+		total, n = 0, 0
+		for value in imap(src.getter(col), rows):
+			total += value
+			n += 1
+		return total / n
+
+	@operation
+	def aggregate(self, aggregates):
+		"""calculate several aggregates of the query result in a single pass
+
+		Keyword arguments:
+		aggregates (dict): each aggregate name mapped to the column, or a list of the columns, to aggregate. See ``agg`` for the aggregates
+
+		Returns:
+		object: self for fluent interface. The result is a dict of the value of each aggregate, named as in ``agg``
+		"""
+		self._plan.append(('aggregate', _parse_aggregates(aggregates)))
 		return self
 
+	def _run_aggregate(self, src, rows, specs):
+		"""calculate each aggregate of ``specs`` over ``rows``"""
+		order, groups = _accumulate(src, rows, specs)
+		values = groups.get(None) or _init_accumulators(_accumulator_specs(specs)[0])
+		return dict(zip([_aggregate_name(*spec) for spec in specs], _finish(specs, values)))
+
+	def stats(self, *cols):
+		"""calculate the count, min, max, avg, var, std and the 50th, 90th and 99th percentiles of columns ``cols`` in a single pass
+
+		Keyword arguments:
+		cols (str): the names of the columns
+
+		Returns:
+		object: self for fluent interface
+		"""
+		return self.aggregate(dict((name, list(cols)) for name in ('count', 'min', 'max', 'avg', 'var', 'std', 'p50', 'p90', 'p99')))
+
 	@operation
 	def distinct(self, col):
 		"""limit the rows in the result set to rows with distinct values in the ``col`` column
+
+		The first row with each value is kept.
 		
 		Keyword arguments:
-		col (str): the name of the column on which to select distinct rows
+		col (str or list): the name of the column, or a list of the columns, on which to select distinct rows
 		
 		Returns:
 		object: self for fluent interface
 		"""
-		self._result = list({item[col] : item for item in self._result}.values())
+		self._plan.append(('distinct', col))
+		return self
+
+	def _run_distinct(self, src, rows, col):
+		"""keep the first row from ``rows`` for each value of column ``col``, only remembering the values seen"""
+		get = _key_getter(src, _key_columns(col))
+		seen = set()
+		for item in rows:
+			value = get(item)
+			if value not in seen:
+				seen.add(value)
+				yield item
+
+	@operation
+	def approx_distinct(self, col):
+		"""estimate the number of distinct values in the column ``col``
+
+		The estimate uses a HyperLogLog sketch of a few kilobytes rather than
+		a set of the values, and is typically within 1% of the exact count.
+
+		Keyword arguments:
+		col (str): the name of the column on which to count distinct values
+
+		Returns:
+		object: self for fluent interface
+		"""
+		self._plan.append(('approx_distinct', col))
 		return self
 
+	def _run_approx_distinct(self, src, rows, col):
+		"""estimate the number of distinct values of column ``col`` of ``rows``"""
+		return self._run_aggregate(src, rows, (('approx_distinct', col),)).values()[0]
+
 	@operation
-	def join(self, other, column, alias="_"):
+	def join(self, other, column, alias="_", how="inner", other_column=None):
 		"""join another table instance where the value of the ``column`` column is eqivalent
+
+		The join is executed when the joined table is queried, so only
+		the columns read by its queries are copied into the joined rows.
+		The rows are joined with a hash table, merged if both
+		tables are ordered by the join columns, or looked up in a hash
+		index created on the join column of ``other`` if this table has
+		fewer rows.
 		
 		Keyword arguments:
 		other (Table): the Table on which to join
-		column (str): the name of the column on which to join the two tables
+		column (str or list): the name of the column, or a list of the columns, on which to join the two tables
 		alias (str): the alias by which the other table can be referred to when referencing its columns
+		how (str): 'inner', 'left', 'right' or 'outer' to also keep the rows without a match in this table, the other table or either, or 'semi' and 'anti' to only keep the rows of this table with or without a match (default: 'inner')
+		other_column (str or list): the join columns of the other table if they are named differently (default: ``column``)
 		
 		Returns:
 		Table: a table instance containing the join result
 		"""
-		tmp = Table()
-		tmp.data = []
-
-		for item in self._result:
-			for oitem in other._result:
-				if item[column] == oitem[column]:
-					n_item = copy.copy(item)
-					for key, value in oitem.items():
-						n_item["%s.%s" % (alias,key) ] = value
-					tmp.data.append(n_item)
-		tmp._setdata(tmp.data)
-		return tmp
+		return self._joined(self._join_op(other, column, alias, False, other_column, how))
 
 	@operation
-	def rjoin(self, other, column, alias="_"):
+	def rjoin(self, other, column, alias="_", how="inner", other_column=None):
 		"""join this table to another Table where the value of the ``column`` column is eqivalent
+
+		The rows of the other table are the outer rows, so a left join
+		keeps the rows of the other table without a match and a semi join
+		keeps the rows of the other table with a match.
 		
 		Keyword arguments:
 		other (Table): the Table on which to join this table
-		column (str): the name of the column on which to join the two tables
+		column (str or list): the name of the column, or a list of the columns, on which to join the two tables
 		alias (str): the alias by which the other table can be referred to when referencing its columns
+		how (str): 'inner', 'left', 'right', 'outer', 'semi' or 'anti' (default: 'inner')
+		other_column (str or list): the join columns of the other table if they are named differently (default: ``column``)
 		
 		Returns:
 		Table: a table instance containing the join result
 		"""
-		tmp = Table()
-		tmp.data = []
+		return self._joined(self._join_op(other, column, alias, True, other_column, how))
+
+	def _joined(self, op):
+		"""build a table of the result of this table's running query joined by the join operation ``op``
+
+		The join isn't executed until the new table is queried, so only the
+		columns read by its queries are copied into the joined rows.  Before
+		either table changes the join is executed and the new table keeps
+		the joined rows.  The running query of this table is left as it is.
+
+		Returns:
+		Table: the joined table
+		"""
+		other, column, alias, right, other_column, how = op[1:]
+		outer, inner = (other, self) if right else (self, other)
+		res = Table(columnar=self.columnar)
+		res.data_format = dict(outer.data_format)
+		if how not in ('semi', 'anti'):
+			res.data_format.update(('%s.%s' % (alias, key), value) for key, value in inner.data_format.items())
+		res._view = (self._table, list(self._plan) + [op])
+		self._table._views.add(res)
+		op[1]._views.add(res)
+		return res
+
+	def _join_op(self, other, column, alias, right, other_column, how):
+		"""build the plan operation of a join
+
+		Raises:
+		ValueError: if ``how`` isn't a join variant or the tables have different numbers of join columns
+		"""
+		if how not in _join_kinds:
+			raise ValueError("unknown join '%s'" % how)
+		column = _key_columns(column)
+		other_column = column if other_column is None else _key_columns(other_column)
+		if len(column) != len(other_column):
+			raise ValueError("join() got %d columns and %d other columns" % (len(column), len(other_column)))
+		if other._start_time is not None:
+			# the other table's query is executed now rather than when it has changed
+			res = Table()
+			res._setdata(other._execute())
+			other = res
+		other._materialize()
+		return ('join', other, column, alias, right, other_column, how)
+
+	def _join_strategy(self, src, plan, other, column, alias, right, other_column, how):
+		"""choose how to join the rows read from ``src`` by the operations of ``plan`` to ``other``
+
+		Returns:
+		str: 'merge' if both inputs are ordered by the join columns, 'index' if ``other`` has a hash index on the join column and more rows, else 'hash'
+		"""
+		other_src = other._source()
+		if _ordered_by(plan, column) and other._rows_ordered(other_src, other_column):
+			return 'merge'
+		if not right and not _join_kinds[how][1] and len(other_column) == 1:
+			index = other._index_for(other_src, _Predicate(other_column[0], 'eq', None))
+			try:
+				fewer = len(src) < len(other_src)
+			except (TypeError, AttributeError):
+				# the rows of a scanned file aren't counted
+				fewer = False
+			if index is not None and fewer:
+				return 'index'
+		return 'hash'
+
+	def _rows_ordered(self, src, columns):
+		"""get whether the rows of ``src``, read from this table, are in ascending order of ``columns``, checked once until the data changes"""
+		key = tuple(columns)
+		if key not in self._ordered:
+			self._ordered[key] = _rows_ordered(src, columns)
+		return self._ordered[key]
+
+	def _run_join(self, src, rows, other, column, alias, right, other_column, how, strategy, columns):
+		"""join ``rows`` to the rows of ``other``, only copying ``columns`` of the joined rows
+
+		Keyword arguments:
+		other (Table): the joined table
+		column (list): the join columns of ``rows``
+		alias (str): the alias applied to the columns of the rows of ``other``, or of ``rows`` if ``right``
+		right (bool): if true the rows of ``other`` are the outer rows
+		other_column (list): the join columns of ``other``
+		how (str): the join variant
+		strategy (str): 'hash', 'merge' or 'index'
+		columns (set): the columns of the joined rows which are read by the rest of the query, or None for every column
+		"""
+		outer_key, inner_key = (other_column, column) if right else (column, other_column)
+		prefix = alias + '.'
+		outer_cols = inner_cols = None
+		if columns is not None:
+			outer_cols = list(set(key for key in columns if not key.startswith(prefix)) | set(outer_key))
+			inner_cols = list(set(key[len(prefix):] for key in columns if key.startswith(prefix)) | set(inner_key))
+		if how in ('semi', 'anti'):
+			inner_cols = inner_key
+		self_cols, other_cols = (inner_cols, outer_cols) if right else (outer_cols, inner_cols)
 
-		for oitem in other._result:
-			for item in self._result:
-				if item[column] == oitem[column]:
-					n_item = copy.copy(oitem)
-					for key, value in item.items():
-						n_item["%s.%s" % (alias,key) ] = value
-					tmp.data.append(n_item)
-		tmp._setdata(tmp.data)
-		return tmp
+		rows = list(src.iter_rows(rows, self_cols))
+		other_src = other._source()
+		if strategy == 'index':
+			index = other._index_for(other_src, _Predicate(other_column[0], 'eq', None))
+			build = other_src.iter_rows
+			fetch = lambda pos: next(build(other_src.refs_at([pos]), other_cols))
+			return _join(rows, (index, fetch), outer_key, inner_key, alias, how, strategy)
+		inner = list(other_src.iter_rows(other_src.refs(), other_cols))
+		if right:
+			return _join(inner, rows, outer_key, inner_key, alias, how, strategy)
+		return _join(rows, inner, outer_key, inner_key, alias, how, strategy)
 
 	def format_json(self):
 		"""set whether the result shown at the end of the query is in JSON format
@@ -586,11 +4476,18 @@ class Table(object):
 		Returns:
 		list: the result of the query
 		"""
+		key = self._cache_key() if self._cache is not None else None
+		cached = self._cache.get(key) if key is not None else _MISSING
+		if cached is not _MISSING:
+			self._result = _copy_result(cached[0])
+			if self.profile:
+				self.last_profile = []
+		else:
+			# strip unnecessary columns as the result rows are built
+			self._result = self._execute(self._select_columns, profile=self.profile)
+			if key is not None:
+				self._cache.put(key, (_copy_result(self._result), list(self._plan)))
 		if type(self._result) is list:
-			# if columns have been selected and the result contains a dictionary
-			if len(self._select_columns) > 0 and type(self._result[0]) is dict:
-				# strip unnecessary columns
-				self._result = [{i:item[i] for i in item if i in self._select_columns} for item in self._result]
 			self._rows_selected = len(self._result)
 		
 		# Calculate processing time and reset
@@ -610,11 +4507,15 @@ class Table(object):
 		Starts a query and disables the fluent interface
 		so that using in a console window won't result in 
 		the table object being printed 
+
+		Returns:
+		_Query: the query the operations in the block are applied to
 		"""
-		self._reset()
+		query = _Query(self if self._table is None else self._table)
 		# Disabling operation returns while in with block
-		self._is_fluent = False
-		return self
+		query._is_fluent = False
+		self._with_queries.append(query)
+		return query
 
 	def __exit__(self, type, value, traceback):
 		"""handle the end of a with block. 
@@ -625,8 +4526,9 @@ class Table(object):
 		list: the result of the query
 		"""
 		# Enabling operation return for final result
-		self._is_fluent = True
-		return self.result(self._show_result)
+		query = self._with_queries.pop()
+		query._is_fluent = True
+		return query.result(query._show_result)
 
 	@operation
 	def __call__(self, show=True):
@@ -638,6 +4540,84 @@ class Table(object):
 		# Process the final operations
 		return self.result(show)
 
+	def acall(self, executor=None):
+		"""Finish a query, returning a future of its result which is executed in a thread pool
+
+		The query is planned immediately and executed in the background,
+		and each chain of operations has its own query state, so another
+		query can be built and started at once, including another ``acall``.  In an asyncio
+		service the future can be awaited with ``asyncio.wrap_future``.
+		The result cache and profiling are not used, and the table data
+		shouldn't be changed until the future is done.
+
+		Keyword arguments:
+		executor (Executor): the executor which runs the query (default: a shared thread pool)
+
+		Returns:
+		Future: the result of the query
+		"""
+		executor = executor or _default_executor()
+		query = self._running()
+		steps = query._compile(query._source(), query._select_columns)
+		query._start_time = None
+		return executor.submit(_run_steps, steps)
+
+	@operation
+	def iter(self, batch_size=None):
+		"""Finish a query, returning an iterator which builds the result rows as they are read
+
+		Rows are read from the table, filtered and projected to the
+		selected columns one at a time, so only operations which need
+		every row (e.g. ``orderby``) hold the result in memory.  The result
+		cache is not used and a new query can be started before the
+		iterator is finished.
+
+		Keyword arguments:
+		batch_size (int): yield lists of up to this many rows rather than single rows (default: None)
+
+		Returns:
+		iterator: the result rows, or the value of an aggregate
+		"""
+		rows = self._execute(self._select_columns, lazy=True, profile=self.profile)
+		if isinstance(rows, list):
+			rows = iter(rows)
+		elif not hasattr(rows, 'next'):
+			rows = iter([rows])
+		self._start_time = None
+		return _batches(rows, batch_size) if batch_size else rows
+
+	def stream(self, batch_size=None):
+		"""Finish a query, returning an iterator over the result rows as they are read, see ``iter``"""
+		return self.iter(batch_size)
+
+class _Query(Table):
+	"""a query of a Table, returned by the first operation of a chain and continued by the rest
+
+	Each operation called on the table starts a new query, so chains built
+	at the same time, e.g. in coroutines awaiting ``acall``, don't share
+	their plans.  Only the query state is kept by the query, everything
+	else is read from and written to the table.
+
+	Attributes:
+		_table (Table): the queried table
+	"""
+	# The attributes kept by the query rather than the table
+	_state = frozenset(['_select_columns', '_start_time', '_show_result', '_is_fluent', '_result', '_plan', '_rows_selected', '_el_time', 'show'])
+
+	def __init__(self, table):
+		"""Constructor. Starts a query of ``table``"""
+		object.__setattr__(self, '_table', table)
+		self._reset()
+
+	def __getattr__(self, name):
+		return getattr(self._table, name)
+
+	def __setattr__(self, name, value):
+		if name in self._state:
+			object.__setattr__(self, name, value)
+		else:
+			setattr(self._table, name, value)
+
 if __name__== "__main__":
 	
 	students = Table()
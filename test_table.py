@@ -1,4 +1,7 @@
-from table import Table
+import json, gzip, random, re
+import pytest
+import table
+from table import Table, col
 
 def test_load():
 	assert Table("students.json").data != []
@@ -10,6 +13,8 @@ def test_count():
 def test_distinct():
 	students = Table("students.json")
 	assert students.distinct("class_id").count()(False) == 3
+	assert [item["id"] for item in students.distinct("class_id")(False)] == [1, 3, 4]
+	assert [item["id"] for item in students.distinct(["class_id", "paid"])(False)] == [1, 2, 3, 4]
 
 def test_eq():
 	students = Table("students.json")
@@ -31,6 +36,16 @@ def test_isin():
 	students = Table("students.json")
 	assert students.isin("class_id",[2,3]).count()(False) == 8
 	
+def test_isin_unhashable():
+	rows = [{"id": 1, "tags": [5, 3]}, {"id": 2, "tags": 5}, {"id": 3, "tags": [1]}]
+	for columnar in (False, True):
+		tbl = Table(columnar=columnar)
+		tbl._setdata(rows)
+		assert tbl.isin("tags", [5, 3]).select(["id"])(False) == [{"id": 2}]
+		assert tbl.notin("tags", [5, 3]).select(["id"])(False) == [{"id": 1}, {"id": 3}]
+		assert tbl.isin("tags", [[5, 3], 4]).select(["id"])(False) == [{"id": 1}]
+		assert tbl.where(col("tags").isin([[1]]) | (col("id") == 2)).select(["id"])(False) == [{"id": 2}, {"id": 3}]
+
 def test_notin():
 	students = Table("students.json")
 	assert students.notin("class_id",[1,2]).count()(False) == 5
@@ -120,4 +135,517 @@ def test_compound():
 	students = Table("students.json")
 	classes = Table("classes.json")
 
-	assert students.join(classes,'class_id','c').eq('paid',True).distinct('c.name').count()(False) == 2
\ No newline at end of file
+	assert students.join(classes,'class_id','c').eq('paid',True).distinct('c.name').count()(False) == 2
+
+	# a joined table can be queried more than once, and its rows read directly
+	joined = students.join(classes, 'class_id', 'c')
+	assert joined.eq('paid', True).distinct('c.name').count()(False) == 2
+	assert joined.eq('paid', True).distinct('c.name').count()(False) == 2
+	assert joined.data_format['c.name'] == 'unicode'
+	assert len(joined.data) == 10
+	assert joined.eq('c.name', 'french').count()(False) == 2
+
+	# a joined table keeps the rows it had when joined after either table changes
+	for how in ('inner', 'semi'):
+		students = Table("students.json")
+		classes = Table("classes.json")
+		joined = students.join(classes, 'class_id', 'c', how=how)
+		assert joined.count()(False) == 10
+		students.append(dict(students.data[0], id=11))
+		students.update(None, {'paid': False})
+		classes.delete(None)
+		assert joined.count()(False) == 10
+		assert joined.eq('paid', True).count()(False) == 4
+		assert len(joined.data) == 10
+
+def test_join_many_to_many():
+	left = Table()
+	left._setdata([{"k": 1, "l": 1}, {"k": 2, "l": 2}, {"k": 1, "l": 3}])
+	right = Table()
+	right._setdata([{"k": 1, "r": 1}, {"k": 1, "r": 2}, {"k": 3, "r": 3}, {"k": 2, "r": 4}, {"k": 2, "r": 5}])
+
+	result = [
+		{"k": 1, "l": 1, "o.k": 1, "o.r": 1},
+		{"k": 1, "l": 1, "o.k": 1, "o.r": 2},
+		{"k": 2, "l": 2, "o.k": 2, "o.r": 4},
+		{"k": 2, "l": 2, "o.k": 2, "o.r": 5},
+		{"k": 1, "l": 3, "o.k": 1, "o.r": 1},
+		{"k": 1, "l": 3, "o.k": 1, "o.r": 2}
+	]
+	assert left.join(right, "k", "o")(False) == result
+	assert right.rjoin(left, "k", "o")(False) == result
+
+def test_lazy_limit():
+	students = Table("students.json")
+	seen = []
+	def paid(item):
+		seen.append(item["id"])
+		return item["paid"]
+	assert students.where(paid).gt("class_id", 1).limit(2)(False) == students.data[1:2] + students.data[4:5]
+	assert seen == [1, 2, 3, 4, 5]
+
+def test_columnar():
+	students = Table("students.json")
+	columns = Table("students.json", columnar=True)
+
+	assert columns.data[0] == students.data[0]
+	assert columns.eq("paid", True).like("name", "^[CR]").select(["id"])(False) == [{u"id": 2}, {u"id": 5}]
+	assert columns.orderby("class_id")(False) == students.orderby("class_id")(False)
+	assert columns.join(Table("classes.json"), "class_id", "c")(False) == students.join(Table("classes.json"), "class_id", "c")(False)
+	assert columns.avg("id")(False) == 5
+
+def test_columnar_mixed_rows():
+	tbl = Table(columnar=True)
+	rows = [{"a": 1, "b": u"x"}, {"a": 2.5, "c": True}, {"a": 3, "b": u"y"}]
+	tbl._setdata(rows)
+
+	assert list(tbl.data) == rows
+	assert tbl.count("b")(False) == 2
+	assert tbl.gt("a", 2)(False) == rows[1:]
+
+def test_vectorized_predicates():
+	rows = Table("students.json").data
+	expected = [row for row in rows if row["class_id"] > 1 and row["paid"] != False and row["id"] not in [2, "x", None] and row["name"] in [u"Rupert", u"Caroline", u"Steve"]]
+
+	numpy = table._numpy
+	try:
+		for use_numpy in (numpy, False):
+			table._numpy = use_numpy
+			students = Table("students.json", columnar=True)
+			assert students.gt("class_id", 1).ne("paid", False).notin("id", [2, "x", None]).isin("name", [u"Rupert", u"Caroline", u"Steve"])(False) == expected
+	finally:
+		table._numpy = numpy
+
+def test_index():
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar)
+		expected = [
+			students.eq("class_id", 2).gt("id", 1)(False),
+			students.isin("class_id", [1, 3]).count()(False),
+			students.gt("id", 7)(False),
+			students.lt("id", 3).eq("paid", True)(False)
+		]
+
+		students.create_index("class_id").create_index("id", kind="sorted")
+		assert "index scan: hash index on class_id: class_id eq 2" in students.eq("class_id", 2).gt("id", 1).explain(False)
+		assert students.eq("class_id", 2).gt("id", 1)(False) == expected[0]
+		assert students.isin("class_id", [1, 3]).count()(False) == expected[1]
+		assert students.gt("id", 7)(False) == expected[2]
+		assert students.lt("id", 3).eq("paid", True)(False) == expected[3]
+		assert students.explain(False)[0] == "scan: 10 rows"
+
+		students._setdata(students.data[:5])
+		assert students.gt("id", 3).count()(False) == 2
+
+def test_scan_json(tmpdir):
+	students = Table("students.json")
+	scan = Table.scan_json("students.json")
+
+	assert scan.data == []
+	assert scan.data_format == students.data_format
+	assert scan.count()(False) == 10
+	assert scan.eq("paid", True).sum("id")(False) == 16
+	assert scan.gt("class_id", 1).limit(3)(False) == students.gt("class_id", 1).limit(3)(False)
+	assert scan.join(Table("classes.json"), "class_id", "c")(False) == students.join(Table("classes.json"), "class_id", "c")(False)
+
+	out = str(tmpdir.join("paid.json"))
+	scan.eq("paid", True).export(out)(False)
+	assert Table(out).data == students.eq("paid", True)(False)
+
+def test_workers(tmpdir):
+	students = Table("students.json")
+	for columnar in (False, True):
+		assert list(Table("students.json", columnar=columnar, workers=3).data) == students.data
+
+	scan = Table.scan_json("students.json", workers=3)
+	assert scan.gt("class_id", 1).count()(False) == 8
+	assert scan.eq("paid", True).sum("id")(False) == 16
+	assert scan.ne("paid", True).min("name")(False) == u"Ferdinand"
+	assert scan.avg("id")(False) == 5
+	assert "parallel aggregate" in scan.lt("id", 4).max("id").explain(False)[0]
+
+	bad = tmpdir.join("bad.json")
+	bad.write('{"id": 1}\n{"id": \n')
+	assert Table(str(bad), workers=2).data == []
+
+def test_load_csv():
+	students = Table("students.json")
+	for columnar in (False, True):
+		csv_students = Table(columnar=columnar)
+		csv_students.load_csv("students.csv", chunk_size=3)
+		assert list(csv_students.data) == students.data
+		assert csv_students.data_format == students.data_format
+
+	assert table._infer_csv_type(["inf", "nan", "Infinity"]) == "unicode"
+	assert table._infer_csv_type(["1.5", "2"]) == "float"
+
+def test_snapshot(tmpdir):
+	students = Table("students.json")
+	students.data[3]["notes"] = [1, "x"]
+	snapshot = str(tmpdir.join("students.snapshot"))
+	students.save_snapshot(snapshot)
+
+	loaded = Table()
+	loaded.load_snapshot(snapshot)
+	assert loaded.data_format == students.data_format
+	assert loaded.eq("paid", True).count()(False) == 4
+	assert loaded.data.columns["name"]._values is None
+	assert list(loaded.data) == students.data
+	assert loaded.orderby("class_id")(False) == students.orderby("class_id")(False)
+
+	bad = tmpdir.join("bad.snapshot")
+	bad.write("not a snapshot")
+	missing = Table()
+	missing.load_snapshot(str(bad))
+	assert missing.data == []
+
+def test_export_formats(tmpdir, monkeypatch):
+	monkeypatch.setattr(table, "_EXPORT_BATCH", 3)
+	students = Table("students.json")
+	expected = students.gt("class_id", 1)(False)
+
+	for name, parallel in (("students.json.gz", False), ("students.bin", 2), ("students.bin.bz2", True)):
+		out = str(tmpdir.join(name))
+		students.gt("class_id", 1).export(out, parallel=parallel)(False)
+		loaded = Table()
+		if name.startswith("students.bin"):
+			loaded.load_binary(out)
+		else:
+			loaded._setdata([json.loads(line) for line in gzip.open(out)])
+		assert loaded.data == expected
+
+	out = str(tmpdir.join("students.csv"))
+	students.gt("class_id", 1).export(out)(False)
+	loaded = Table()
+	loaded.load_csv(out)
+	assert loaded.data == expected
+	assert open(out).readline() == "class_id,id,name,paid\r\n"
+
+	# every format writes only the selected columns
+	for name in ("selected.json", "selected.bin", "selected.csv"):
+		out = str(tmpdir.join(name))
+		students.select(["id"]).limit(1).export(out)(False)
+		loaded = Table()
+		{"json": loaded.load_json, "bin": loaded.load_binary, "csv": loaded.load_csv}[name.split(".")[1]](out)
+		assert loaded.data == [{"id": 1}]
+
+def test_groupby_agg():
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar)
+		res = students.groupby("class_id").agg(count=None, sum="id", min="name", max="id", avg="id")(False)
+		assert res == [
+			{"class_id": 2, "count": 3, "sum_id": 8, "min_name": "Caroline", "max_id": 5, "avg_id": 2},
+			{"class_id": 1, "count": 2, "sum_id": 9, "min_name": "Frank", "max_id": 6, "avg_id": 4},
+			{"class_id": 3, "count": 5, "sum_id": 38, "min_name": "Ferdinand", "max_id": 10, "avg_id": 7},
+		]
+
+		res = students.gt("id", 2).groupby(["class_id", "paid"]).agg(count=None).orderby("count", True)(False)
+		assert res[0] == {"class_id": 3, "paid": False, "count": 5}
+		assert len(res) == 3
+		assert students.agg(sum=["id", "class_id"])(False) == [{"sum_id": 55, "sum_class_id": 23}]
+
+def test_aggregate():
+	students = Table("students.json")
+	res = students.gt("class_id", 1).aggregate({"min": "id", "max": ["id", "name"], "count": None, "var": "id"})(False)
+	assert res == {"min_id": 1, "max_id": 10, "max_name": "Steve", "count": 8, "var_id": 9.4375}
+
+	stats = students.stats("id")(False)
+	assert stats["count_id"] == 10 and stats["avg_id"] == 5
+	assert stats["p50_id"] == 5.5 and stats["p90_id"] == 9.5
+	assert round(stats["std_id"] ** 2, 6) == 8.25
+	assert students.eq("id", 0).aggregate({"count": None, "min": "id"})(False) == {"count": 0, "min_id": None}
+
+	scan = Table.scan_json("students.json", workers=3)
+	assert scan.stats("id")(False) == stats
+
+def test_tdigest():
+	rnd = random.Random(1)
+	values = [rnd.random() for i in range(50000)]
+	digest = table._TDigest()
+	digest.extend(values[:20000])
+	digest.merge(table._TDigest().extend(values[20000:]))
+	assert len(digest.centroids) < 200
+	assert abs(digest.quantile(0.5) - 0.5) < 0.01
+	assert abs(digest.quantile(0.99) - sorted(values)[49500]) < 0.001
+
+def test_topn():
+	students = Table("students.json", columnar=True)
+	rows = list(students.data)
+	for key, reverse in (("class_id", False), ("class_id", True), (["class_id", "paid"], [False, True]), (["paid", "name"], [True, False])):
+		expected = list(rows)
+		for col, desc in reversed(zip(key, reverse) if isinstance(key, list) else [(key, reverse)]):
+			expected.sort(key=lambda item: item[col], reverse=desc)
+		assert students.orderby(key, reverse)(False) == expected
+		for n in (0, 1, 4, 20):
+			assert students.orderby(key, reverse).limit(n)(False) == expected[:n]
+			assert students.topn(key, n, reverse)(False) == expected[:n]
+			assert students.topn(key, -n, reverse)(False) == students.orderby(key, reverse).limit(-n)(False)
+
+	assert [item["id"] for item in students.orderby("class_id", True).limit(4)(False)] == [4, 7, 8, 9]
+	assert [item["id"] for item in students.orderby(["class_id", "id"], [False, True]).limit(3)(False)] == [6, 3, 5]
+	assert students.orderby("class_id").limit(3).explain(False)[1] == "topn: class_id, 3, False"
+
+def test_external_sort(tmpdir):
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar)
+		expected = [students.orderby(key, reverse)(False) for key, reverse in (("class_id", False), ("name", True), (["paid", "class_id"], [True, False]))]
+		for budget in (1, 3, 10):
+			students.sort_budget = budget
+			assert [students.orderby(key, reverse)(False) for key, reverse in (("class_id", False), ("name", True), (["paid", "class_id"], [True, False]))] == expected
+
+		out = str(tmpdir.join("sorted%s.json" % columnar))
+		students.orderby("class_id").export(out)(False)
+		assert Table(out).data == expected[0]
+
+	students = Table("students.json")
+	for budget in (0, -1):
+		students.sort_budget = budget
+		with pytest.raises(ValueError):
+			students.orderby("id")(False)
+
+def test_approx_distinct():
+	students = Table("students.json")
+	assert students.approx_distinct("class_id")(False) == 3
+	assert students.groupby("class_id").agg(approx_distinct="name")(False)[0]["approx_distinct_name"] == 3
+
+	rnd = random.Random(1)
+	sketch = table._HyperLogLog()
+	sketch.extend([rnd.randint(0, 10 ** 9) for i in range(100000)])
+	other = table._HyperLogLog().extend([u"value%d" % i for i in range(50000)])
+	assert abs(sketch.count() - 100000) < 2000
+	assert abs(sketch.merge(other).count() - 150000) < 3000
+
+def test_expressions():
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar)
+		ids = lambda tbl: [item["id"] for item in tbl(False)]
+		assert ids(students.where((col("class_id") >= 2) & col("name").isin(["Steve", "Penny", "Frank"]))) == [1, 7]
+		assert ids(students.where((col("id") <= 2) | ~col("name").like("^[A-P]"))) == [1, 2, 5]
+		assert ids(students.where((col("paid") == True) & (col("id") != 2) & (col("class_id") < 3)).where(lambda item: item["id"] > 3)) == [5, 6]
+		assert ids(students.where(col("name").notlike("e") & col("class_id").notin([1]))) == [4, 8]
+
+		students.create_index("id", kind="sorted")
+		assert ids(students.where((col("id") >= 9) & (col("paid") == False))) == [9, 10]
+		assert students.where((col("id") >= 9) & (col("paid") == False)).explain(False)[0] == "index scan: sorted index on id: id ge 9"
+
+	assert isinstance(table._Predicate("id", "isin", [1, 2]).operand, frozenset)
+	assert table._Predicate("id", "isin", [[1], 2]).test([1])
+
+	table._filter_cache.clear()
+	students = Table("students.json")
+	for value in (1, 2, 3):
+		students.gt("id", value).eq("paid", True)(False)
+	assert len(table._filter_cache) == 1
+
+	scan = Table.scan_json("students.json", workers=2)
+	assert scan.where((col("class_id") == 1) | (col("id") == 4)).count()(False) == 3
+
+def test_like_patterns():
+	students = Table("students.json")
+	names = lambda tbl: [item["name"] for item in tbl(False)]
+	for pattern in ("er", "^P", "^Pr.d", "e.*a$", "(?i)^f", "a|u", "r+i", ""):
+		expected = [item["name"] for item in students.data if re.search(pattern, item["name"])]
+		assert names(students.like("name", pattern)) == expected
+		assert len(students.notlike("name", pattern)(False)) == 10 - len(expected)
+	assert table._like_pattern("^Pr.d") is table._like_pattern("^Pr.d")
+
+	students.create_index("name", kind="ngram")
+	assert names(students.like("name", "in.n")) == ["Ferdinand"]
+	assert names(students.like("name", "ine")) == ["Caroline"]
+	assert names(students.like("name", "inz")) == []
+	assert students.like("name", "dinan").explain(False)[:2] == ["index scan: ngram index on name: name like 'dinan'", "filter: name like 'dinan'"]
+
+def test_result_cache():
+	students = Table("students.json").enable_cache(2)
+	first = students.eq("paid", True).gt("class_id", 1)(False)
+	first.append(None)
+	assert students.gt("class_id", 1).eq("paid", True)(False) == first[:-1]
+	assert students.cache_info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+	assert students.where(lambda item: item["paid"]).count()(False) == 4
+	assert students.groupby("class_id").agg(count=None)(False) == students.groupby("class_id").agg(count=None)(False)
+	assert students.count()(False) == 10
+	assert students.gt("class_id", 1).eq("paid", True)(False) == first[:-1]
+	assert students.cache_info() == {"hits": 2, "misses": 4, "size": 2, "maxsize": 2}
+
+	students.load_json("students.json")
+	assert students.cache_info()["size"] == 0
+	assert students.disable_cache().cache_info() is None
+
+def test_mutation(tmpdir):
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar).enable_cache()
+		students.create_index("class_id").create_index("id", kind="sorted").create_index("name", kind="ngram")
+		assert students.eq("class_id", 3).count()(False) == 5
+		assert students.max("id")(False) == 10
+		assert students.eq("paid", True).sum("id")(False) == 16
+
+		students.append([{"id": 11, "name": "Hilda", "class_id": 3, "paid": True, "year": 2}])
+		assert students.cache_info()["size"] == 3
+		assert students.eq("class_id", 3).count()(False) == 6
+		assert students.max("id")(False) == 11
+		assert students.eq("paid", True).sum("id")(False) == 27
+		assert students.cache_info()["misses"] == 3
+		assert students.data_format["year"] == "int"
+		assert students.gt("id", 9).select("name")(False) == [{"name": "Ferdinand"}, {"name": "Hilda"}]
+
+		students.update(col("class_id") == 2, {"class_id": 4, "paid": lambda item: not item["paid"]})
+		assert students.eq("class_id", 2).count()(False) == 0
+		assert [item["id"] for item in students.eq("class_id", 4).eq("paid", True)(False)] == [1]
+		students.update(col("id") == 3, {"name": "Francis"})
+		assert students.like("name", "ncis$")(False)[0]["id"] == 3
+
+		students.delete(col("class_id") == 3)
+		assert students.count()(False) == 5
+		assert [item["id"] for item in students.eq("class_id", 4)(False)] == [1, 2, 5]
+		assert [item["id"] for item in students.where(col("id") >= 5)(False)] == [5, 6]
+		assert students.like("name", "ncis$")(False)[0]["id"] == 3
+		assert students.like("name", "erdin")(False) == []
+
+	# cached results which can't be updated from the new rows are discarded
+	partial = Table("students.json").enable_cache()
+	assert partial.eq("paid", True).count()(False) == 4
+	partial.append({"id": 11})
+	assert len(partial.data) == 11
+	assert partial.cache_info()["size"] == 0
+
+	log = tmpdir.join("log.json")
+	log.write('{"id": 1}\n{"id": 2}\n{"id"')
+	events = Table()
+	offset = events.extend_from_file(str(log))
+	assert events.count()(False) == 2
+	log.write(': 3}\n', mode="a")
+	offset = events.extend_from_file(str(log), offset)
+	assert offset == log.size()
+	assert [item["id"] for item in events(False)] == [1, 2, 3]
+	log.write('{"id": 4\n{"id": 5}\n', mode="a")
+	assert events.extend_from_file(str(log), offset) == log.size()
+	assert [item["id"] for item in events(False)] == [1, 2, 3, 5]
+
+def test_profile():
+	students = Table("students.json")
+	query = students.eq("paid", False).orderby("id").limit(2)
+	profile = query.explain(False, analyze=True)
+	assert [entry["step"] for entry in profile] == ["scan", "filter", "topn", "result"]
+	assert [(entry["rows_in"], entry["rows_out"]) for entry in profile] == [(10, 10), (10, 6), (6, 2), (2, 2)]
+	assert all(entry["time"] >= 0 for entry in profile)
+	assert query(False) == [{"id": 1, "name": "Steve", "class_id": 2, "paid": False}, {"id": 4, "name": "Jacinta", "class_id": 3, "paid": False}]
+
+	students.profile = True
+	assert students.eq("class_id", 3).count()(False) == 5
+	assert [(entry["step"], entry["rows_out"]) for entry in students.last_profile] == [("scan", 10), ("filter", 5), ("count", 1)]
+
+def test_iter():
+	for columnar in (False, True):
+		students = Table("students.json", columnar=columnar)
+		expected = students.gt("class_id", 1).select(["id", "name"])(False)
+		rows = students.gt("class_id", 1).select(["id", "name"]).iter()
+		assert next(rows) == expected[0]
+		assert students.count()(False) == 10
+		assert list(rows) == expected[1:]
+
+		batches = list(students.gt("class_id", 1).select(["id", "name"]).stream(batch_size=3))
+		assert [len(batch) for batch in batches] == [3, 3, 2]
+		assert sum(batches, []) == expected
+		assert list(students.eq("paid", True).count().iter()) == [4]
+
+def test_iter_append():
+	# appending moves the column arrays while the masks of an unfinished query still read them
+	tbl = Table(columnar=True)
+	tbl._setdata([{"id": i, "name": u"n%d" % (i % 7)} for i in xrange(70000)])
+	expected = tbl.gt("id", -1).isin("name", [u"n1", u"n2"])(False)
+	rows = tbl.gt("id", -1).isin("name", [u"n1", u"n2"]).iter()
+	assert next(rows) == expected[0]
+	tbl.append([{"id": -1, "name": u"m%d" % i} for i in xrange(200000)])
+	assert list(rows) == expected[1:]
+
+def test_projection():
+	scan = Table.scan_json("students.json")
+	classes = Table("classes.json")
+	assert table._projections([("where", col("paid") == True), ("orderby", "id", False)], ["name"]) == [set(["paid", "id", "name"]), set(["id", "name"]), set(["name"])]
+	assert table._projections([("where", lambda item: item["paid"]), ("count", None)], []) == [None, set(), None]
+
+	joined = scan.join(classes, "class_id", "c")
+	query = joined.eq("paid", True).select(["name", "c.name"])
+	steps = query.explain(False)
+	assert steps[0] == "scan: students.json keeping class_id, name, paid"
+	assert steps[1] == "join: hash inner join to 3 rows as c on class_id, keeping c.name, name, paid"
+	assert query(False) == [{"name": "Caroline", "c.name": "italian"}, {"name": "Frank", "c.name": "french"}, {"name": "Rupert", "c.name": "italian"}, {"name": "Guiseppe", "c.name": "french"}]
+
+	students = Table("students.json", columnar=True)
+	assert students.rjoin(classes, "class_id", "s").gt("s.id", 8).select(["name", "s.name"])(False) == [{"name": "spanish", "s.name": "Prudence"}, {"name": "spanish", "s.name": "Ferdinand"}]
+	assert students.join(classes.eq("class_id", 1), "class_id", "c").count()(False) == 2
+
+def test_join_kinds():
+	left = Table()
+	left._setdata([{"k": 1, "l": 1}, {"k": 2, "l": 2}, {"k": 4, "l": 3}, {"k": 1, "l": 4}])
+	right = Table()
+	right._setdata([{"key": 1, "r": 1}, {"key": 3, "r": 2}, {"key": 1, "r": 3}])
+
+	inner = [{"k": 1, "l": 1, "o.key": 1, "o.r": 1}, {"k": 1, "l": 1, "o.key": 1, "o.r": 3}, {"k": 1, "l": 4, "o.key": 1, "o.r": 1}, {"k": 1, "l": 4, "o.key": 1, "o.r": 3}]
+	assert left.join(right, "k", "o", other_column="key")(False) == inner
+	assert left.join(right, "k", "o", how="left", other_column="key")(False) == inner[:2] + [{"k": 2, "l": 2}, {"k": 4, "l": 3}] + inner[2:]
+	assert left.join(right, "k", "o", how="right", other_column="key")(False) == inner + [{"o.key": 3, "o.r": 2}]
+	assert len(left.join(right, "k", "o", how="outer", other_column="key")(False)) == 7
+	assert left.join(right, "k", "o", how="semi", other_column="key")(False) == [{"k": 1, "l": 1}, {"k": 1, "l": 4}]
+	assert left.join(right, "k", "o", how="anti", other_column="key").select(["l"])(False) == [{"l": 2}, {"l": 3}]
+	assert left.rjoin(right, "k", "o", how="anti", other_column="key")(False) == [{"key": 3, "r": 2}]
+
+	# merge join of inputs ordered by the key, and an index join into a larger table
+	sorted_right = Table()
+	sorted_right._setdata(right.orderby("key")(False))
+	joined = left.orderby("k").join(sorted_right, "k", "o", other_column="key")
+	assert joined.explain(False)[2].startswith("join: merge inner join")
+	assert joined(False) == sorted(inner, key=lambda item: item["k"])
+	assert left(False) == left.data
+	# the order of the other table is checked once, and again after it changes
+	assert sorted_right._ordered == {("key",): True}
+	sorted_right.append({"key": -1, "r": 9})
+	assert sorted_right._ordered == {}
+	assert left.orderby("k").join(sorted_right, "k", "o", other_column="key").explain(False)[2].startswith("join: hash inner join")
+
+	right.create_index("key")
+	small = Table()
+	small._setdata([{"k": 3}])
+	joined = small.join(right, "k", "o", how="left", other_column="key")
+	assert joined.explain(False)[1].startswith("join: index left join")
+	assert joined(False) == [{"k": 3, "o.key": 3, "o.r": 2}]
+
+	students = Table("students.json", columnar=True)
+	pairs = [{"class_id": 2, "paid": True, "n": 5}, {"class_id": 3, "paid": False, "n": 2}]
+	other = Table()
+	other._setdata(pairs)
+	assert students.join(other, ["class_id", "paid"], "p").select(["id", "p.n"])(False) == [{"id": 2, "p.n": 5}, {"id": 4, "p.n": 2}, {"id": 5, "p.n": 5}, {"id": 7, "p.n": 2}, {"id": 8, "p.n": 2}, {"id": 9, "p.n": 2}, {"id": 10, "p.n": 2}]
+
+def test_acall():
+	if not table._futures:
+		pytest.skip("the futures package isn't installed")
+	students = Table.aload_json("students.json", columnar=True).result()
+	first = students.eq("paid", True).orderby("id", True).select(["id"]).acall()
+	second = students.gt("class_id", 2).count().acall()
+	assert students.eq("class_id", 1).select(["name"])(False) == [{"name": "Frank"}, {"name": "Guiseppe"}]
+	assert first.result() == [{"id": 6}, {"id": 5}, {"id": 3}, {"id": 2}]
+	assert second.result() == 5
+
+	# chains built at the same time each keep their own query
+	paid = students.eq("paid", True)
+	later = students.gt("class_id", 2)
+	assert paid.count().acall().result() == 4
+	assert later.count().acall().result() == 5
+
+def test_interleaved_queries():
+	students = Table("students.json")
+	paid = students.eq("paid", True)
+	later = students.gt("class_id", 2).select(["id"])
+	paid.select(["name"])
+	later.limit(2)
+	assert students.count()(False) == 10
+	assert later(False) == [{"id": 4}, {"id": 7}]
+	assert paid.count()(False) == 4
+	assert paid.eq("class_id", 1).count()(False) == 2
+
+	with students as query:
+		query.eq("class_id", 2)
+		students.eq("paid", False).count()(False)
+		query.eq("paid", True)
+	assert query._result == [row for row in students.data if row["class_id"] == 2 and row["paid"]]